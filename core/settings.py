@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,9 +24,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-t97dyq*i!7_=8s&%(cdyld-7ms@*s=c*_)-smmxzl8u7p9&k1m'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -52,6 +53,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'portal.slow_queries.SlowQueryLogMiddleware',
+    'portal.profiling.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -81,7 +84,32 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Token-bucket rates for portal.throttling (burst size / refill period)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_username': '10/min',
+        'register_ip': '20/hour',
+    },
+    # Trusted reverse proxies in front of the app; 0 uses REMOTE_ADDR only
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+SHARED_STATE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Host-local cache shared by all worker processes. Kept on tmpfs where
+    # available so reads and writes stay in memory.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SHARED_CACHE_DIR', os.path.join(SHARED_STATE_DIR, 'student-mentor-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
 }
+# SQLite file holding the login and registration throttle buckets of all workers on the host
+THROTTLE_DB_PATH = os.environ.get('THROTTLE_DB_PATH', os.path.join(SHARED_STATE_DIR, 'student-mentor-throttle.sqlite3'))
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_METHODS = [
@@ -157,3 +185,77 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Background jobs (portal.jobs)
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', 2))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+# Seconds without a progress heartbeat before a running job is considered abandoned
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
+JOB_EXPORT_DIR = BASE_DIR / 'exports'
+# Scores deleted per transaction when purging a deleted test
+TEST_PURGE_BATCH_SIZE = int(os.environ.get('TEST_PURGE_BATCH_SIZE', 1000))
+# Score history retention (compact_score_history)
+SCORE_HISTORY_RETENTION_DAYS = int(os.environ.get('SCORE_HISTORY_RETENTION_DAYS', 365))
+SCORE_HISTORY_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Cohort students join when they register without a cohort_code; empty to require a code.
+# Mentors never join it implicitly.
+DEFAULT_COHORT_CODE = os.environ.get('DEFAULT_COHORT_CODE', 'default')
+
+# Server-sent score events (portal.events)
+SCORE_EVENTS_POLL_INTERVAL = float(os.environ.get('SCORE_EVENTS_POLL_INTERVAL', 1.0))
+# Events buffered per connection before a slow client is disconnected
+SCORE_EVENTS_QUEUE_SIZE = int(os.environ.get('SCORE_EVENTS_QUEUE_SIZE', 256))
+SCORE_EVENTS_HEARTBEAT = 15
+SCORE_EVENTS_RETRY_MS = 3000
+
+# Per-process Test cache (portal.cache)
+TEST_CACHE_SIZE = int(os.environ.get('TEST_CACHE_SIZE', 1024))
+# Max seconds another worker may serve a Test after it was changed elsewhere
+TEST_CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('TEST_CACHE_VERSION_CHECK_INTERVAL', 1.0))
+# Cache alias holding the shared version token; point it at memcached/redis for multi-host deployments
+TEST_CACHE_VERSION_CACHE = 'shared'
+
+# Slow query log (portal.slow_queries); off unless SLOW_QUERY_LOG=1
+SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG', '0') == '1'
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+# Entries kept in memory per process for /portal/slow-queries/
+SLOW_QUERY_BUFFER_SIZE = 500
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE', BASE_DIR / 'logs' / 'slow_queries.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {},
+    'loggers': {},
+}
+if SLOW_QUERY_LOG_ENABLED:
+    os.makedirs(os.path.dirname(SLOW_QUERY_LOG_FILE), exist_ok=True)
+    LOGGING['handlers']['slow_queries'] = {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': SLOW_QUERY_LOG_FILE,
+        'maxBytes': 10 * 1024 * 1024,
+        'backupCount': 5,
+    }
+    LOGGING['loggers']['portal.slow_queries'] = {
+        'handlers': ['slow_queries'],
+        'level': 'WARNING',
+        'propagate': False,
+    }
+
+# Request profiling (portal.profiling): staff can always use ?profile=1;
+# set PROFILE_SAMPLE_EVERY=N to also profile 1 in N requests in the background
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', 0))
+PROFILE_AGGREGATE_DUMP_EVERY = 100
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Production server (manage.py serve)
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 1))
+# Requests a worker serves before it is gracefully replaced (0 never), plus up to
+# the jitter more so that workers do not all restart at once
+SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 10000))
+SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 1000))
+# Seconds a stopping worker waits for open requests to finish
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+# Workers serve STATIC_URL (the admin's CSS and JS) themselves; 0 when a reverse proxy does
+SERVER_SERVE_STATIC = os.environ.get('SERVER_SERVE_STATIC', '1') == '1'
@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from .cache import test_cache
+from .cohorts import CohortTest, shares_cohort_with, user_cohort_ids
+from .models import StudentProfile, MentorProfile, Test
+
+# Route name -> (model, URL kwarg holding its id) for lookups the loader can merge
+BATCHABLE_ROUTES = {
+    'student-profile-detail': (StudentProfile, 'student_id'),
+    'test-detail': (Test, 'test_id'),
+}
+
+_UNSET = object()
+
+
+def _loader_queryset(model, user):
+    if model is StudentProfile:
+        # Nested tests come from the Test cache rather than select_related; the
+        # cohort check rides along in the same query
+        return (StudentProfile.objects.select_related('user').prefetch_related('testscore_set')
+                .annotate(in_mentor_cohorts=shares_cohort_with(user)))
+    return model.objects.all()
+
+
+class BatchLoader:
+    """
+    Identity map shared by the sub-requests of one /batch/ call.
+
+    Ids are registered up front with want(); the first get() for a model
+    fetches every wanted id of that model with a single `id__in` query, so
+    N profile lookups cost one query instead of N. The caller's mentor
+    profile is looked up at most once per batch.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._pending = defaultdict(set)
+        self._objects = {}
+        self._mentor_profile = _UNSET
+
+    def want(self, model, pk):
+        if (model, pk) not in self._objects:
+            self._pending[model].add(pk)
+
+    def get(self, model, pk):
+        """
+        Return the instance with this id, or None if it does not exist
+        """
+        if (model, pk) not in self._objects:
+            self.want(model, pk)
+            ids = self._pending.pop(model)
+            if model is Test:
+                # Tests outside the user's cohorts are treated as missing
+                visible = set(CohortTest.objects.filter(test_id__in=ids, cohort_id__in=user_cohort_ids(self.user))
+                              .values_list('test_id', flat=True))
+                found = {test_id: entry[0] for test_id, entry in test_cache.get_many(visible).items()}
+            else:
+                found = _loader_queryset(model, self.user).in_bulk(ids)
+            for loaded_id in ids:
+                self._objects[(model, loaded_id)] = found.get(loaded_id)
+        return self._objects[(model, pk)]
+
+    def mentor_profile(self):
+        if self._mentor_profile is _UNSET:
+            self._mentor_profile = MentorProfile.objects.select_related('user').filter(user=self.user).first()
+        return self._mentor_profile
+
+
+def build_sub_request(request, path, query_string, loader):
+    """
+    A bare GET request for `path` that reuses the batch's authentication
+    """
+    sub_request = HttpRequest()
+    sub_request.method = 'GET'
+    sub_request.path = sub_request.path_info = path
+    sub_request.META = {
+        key: value for key, value in request.META.items()
+        if not key.startswith('wsgi.') and key not in ('CONTENT_LENGTH', 'CONTENT_TYPE')
+    }
+    sub_request.META.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query_string})
+    sub_request.GET = QueryDict(query_string)
+    # DRF skips the authenticators when these are set
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    sub_request.batch_loader = loader
+    return sub_request
+
+
+def resolve_sub_request(path, allowed_view):
+    """
+    Resolve `path` to a portal API view, or return None if it is not allowed
+    """
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    view_class = getattr(match.func, 'view_class', None)
+    if view_class is None or not allowed_view(view_class):
+        return None
+    return match
@@ -0,0 +1,158 @@
+"""
+Per-process read-through cache for Test rows.
+
+Tests are few and read on almost every request (test detail, score
+validation, and nested in every serialized score), so each worker keeps an
+LRU of Test instances and their serialized form. Workers agree on freshness
+through a version token kept in a shared Django cache: any write to a Test
+replaces the token, and each worker compares it with the one its entries were
+loaded under at most every TEST_CACHE_VERSION_CHECK_INTERVAL seconds, clearing
+itself when it changed. The writing process clears immediately.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY = 'portal:test-cache-version'
+
+
+class TestCache:
+    def __init__(self, maxsize, check_interval, version_cache_alias):
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self.version_cache_alias = version_cache_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = float('-inf')
+        # Bumped on every clear so loads that raced an invalidation are discarded
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def _version_cache(self):
+        return caches[self.version_cache_alias]
+
+    def _sync_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = self._version_cache.get(VERSION_KEY)
+        if version is None:
+            self._version_cache.add(VERSION_KEY, secrets.token_hex(8), None)
+            version = self._version_cache.get(VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._generation += 1
+                self._version = version
+
+    def _load(self, ids):
+        from .models import Test
+        from .serializers import TestSerializer
+
+        generation = self._generation
+        found = Test.objects.in_bulk(ids)
+        entries = {test_id: (test, TestSerializer(test).data) for test_id, test in found.items()}
+        with self._lock:
+            if generation != self._generation:
+                return entries
+            for test_id, entry in entries.items():
+                self._entries[test_id] = entry
+                self._entries.move_to_end(test_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entries
+
+    def get_many(self, ids):
+        """
+        Map of id -> (Test, serialized data) for the ids that exist and are
+        visible, querying only for ids not already cached
+        """
+        self._sync_version()
+        result = {}
+        missing = []
+        with self._lock:
+            for test_id in ids:
+                entry = self._entries.get(test_id)
+                if entry is None:
+                    missing.append(test_id)
+                else:
+                    self._entries.move_to_end(test_id)
+                    result[test_id] = entry
+            self.hits += len(result)
+            self.misses += len(missing)
+        if missing:
+            result.update(self._load(missing))
+        return result
+
+    def get(self, test_id):
+        """
+        The Test with this id, or None if it does not exist or is hidden.
+        The instance is shared; do not modify it.
+        """
+        entry = self.get_many([test_id]).get(test_id)
+        return entry[0] if entry else None
+
+    def get_data(self, test_id):
+        """
+        TestSerializer output for this id, or None
+        """
+        entry = self.get_many([test_id]).get(test_id)
+        return entry[1] if entry else None
+
+    def invalidate(self):
+        """
+        Drop every cached Test here and, via the shared version, in all other workers
+        """
+        self._version_cache.set(VERSION_KEY, secrets.token_hex(8), None)
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._version = None
+            self.invalidations += 1
+        self._checked_at = float('-inf')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+test_cache = TestCache(
+    maxsize=settings.TEST_CACHE_SIZE,
+    check_interval=settings.TEST_CACHE_VERSION_CHECK_INTERVAL,
+    version_cache_alias=settings.TEST_CACHE_VERSION_CACHE,
+)
+
+
+def invalidate_tests():
+    """
+    Call after writing Test rows. Clears this process now, and again once the
+    transaction commits so other workers cannot reload pre-commit data under
+    the new version.
+    """
+    test_cache.invalidate()
+    transaction.on_commit(test_cache.invalidate)
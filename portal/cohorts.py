@@ -0,0 +1,104 @@
+"""
+Cohort scoping.
+
+Membership lives in the Cohort many-to-many tables, which are indexed on
+(cohort, member) and on member. The helpers here return lazy subqueries over
+those tables rather than lists of ids, so a view filters by cohort inside its
+own SQL and a mentor's queries cost in proportion to their cohorts, not to the
+whole table.
+"""
+import secrets
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Cohort
+
+CohortMentor = Cohort.mentors.through
+CohortStudent = Cohort.students.through
+CohortTest = Cohort.tests.through
+
+
+def mentor_cohort_ids(mentor_profile, cohort_id=None):
+    """
+    The mentor's cohorts, narrowed to cohort_id when given (empty if it is not theirs)
+    """
+    memberships = CohortMentor.objects.filter(mentorprofile_id=mentor_profile.id)
+    if cohort_id is not None:
+        memberships = memberships.filter(cohort_id=cohort_id)
+    return memberships.values('cohort_id')
+
+
+def user_cohort_ids(user):
+    """
+    Cohorts the user belongs to as a mentor or as a student
+    """
+    return Cohort.objects.filter(
+        Q(id__in=CohortMentor.objects.filter(mentorprofile__user=user).values('cohort_id'))
+        | Q(id__in=CohortStudent.objects.filter(studentprofile__user=user).values('cohort_id'))
+    ).values('id')
+
+
+def cohort_student_ids(cohort_ids):
+    return CohortStudent.objects.filter(cohort_id__in=cohort_ids).values('studentprofile_id')
+
+
+def cohort_mentor_ids(cohort_ids):
+    return CohortMentor.objects.filter(cohort_id__in=cohort_ids).values('mentorprofile_id')
+
+
+def cohort_test_ids(cohort_ids):
+    return CohortTest.objects.filter(cohort_id__in=cohort_ids).values('test_id')
+
+
+def shares_cohort_with(user):
+    """
+    Annotation for StudentProfile querysets: True if the student is in one of
+    the user's mentor cohorts
+    """
+    return Exists(CohortStudent.objects.filter(
+        studentprofile_id=OuterRef('id'),
+        cohort_id__in=CohortMentor.objects.filter(mentorprofile__user=user).values('cohort_id'),
+    ))
+
+
+def mentor_can_view_student(mentor_profile, student_profile):
+    # Profiles loaded through a BatchLoader carry the answer already
+    annotated = getattr(student_profile, 'in_mentor_cohorts', None)
+    if annotated is not None:
+        return annotated
+    return CohortStudent.objects.filter(
+        studentprofile_id=student_profile.id, cohort_id__in=mentor_cohort_ids(mentor_profile),
+    ).exists()
+
+
+def test_in_cohorts(test_id, cohort_ids):
+    return CohortTest.objects.filter(test_id=test_id, cohort_id__in=cohort_ids).exists()
+
+
+def default_cohort():
+    """
+    The cohort new students join without a code, or None if DEFAULT_COHORT_CODE is empty.
+    Found by its flag, never by its public code, so a cohort a mentor created
+    can never become the default one.
+    """
+    if not settings.DEFAULT_COHORT_CODE:
+        return None
+    cohort = Cohort.objects.filter(is_default=True).first()
+    if cohort is not None:
+        return cohort
+    code = settings.DEFAULT_COHORT_CODE
+    if Cohort.objects.filter(code=code).exists():
+        # Taken by a cohort created before the code was reserved
+        code = generate_code()
+    try:
+        with transaction.atomic():
+            return Cohort.objects.create(name='Default', code=code, is_default=True)
+    except IntegrityError:
+        # Created concurrently by another registration
+        return Cohort.objects.get(is_default=True)
+
+
+def generate_code():
+    return secrets.token_urlsafe(6)
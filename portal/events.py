@@ -0,0 +1,246 @@
+"""
+In-process fan-out of test score changes to server-sent-event streams.
+
+Each event loop has one ScoreEventBroker. While it has subscribers, a single
+poller task reads new TestScoreHistory rows (one cheap indexed query per
+interval, however many clients are connected) and pushes them to every
+subscriber's bounded queue. Writes made in this process wake the poller
+immediately; writes from other worker processes are picked up on the next
+poll. Each subscriber only receives rows for students in its cohorts; the
+poller looks up the cohorts of a batch's students with one query. History ids
+double as SSE event ids, so a reconnecting client resumes from Last-Event-ID
+by replaying history rows it missed.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cohorts import CohortStudent, cohort_student_ids
+from .models import TestScoreHistory
+
+logger = logging.getLogger('portal.events')
+
+_brokers = weakref.WeakKeyDictionary()
+
+# Longest wait between retries while polling keeps failing, in seconds
+POLL_RETRY_MAX_DELAY = 30
+
+
+def _fetch_after(last_id, limit, cohort_ids=None):
+    entries = TestScoreHistory.objects.filter(id__gt=last_id)
+    if cohort_ids is not None:
+        entries = entries.filter(student_id__in=cohort_student_ids(cohort_ids))
+    return list(
+        entries.order_by('id')
+        .values('id', 'timestamp', 'action', 'score_id', 'student_id', 'test_id', 'score')[:limit]
+    )
+
+
+def _student_cohorts(student_ids):
+    cohorts = {}
+    for student_id, cohort_id in CohortStudent.objects.filter(
+        studentprofile_id__in=student_ids,
+    ).values_list('studentprofile_id', 'cohort_id'):
+        cohorts.setdefault(student_id, set()).add(cohort_id)
+    return cohorts
+
+
+def _latest_id():
+    return TestScoreHistory.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def format_event(row):
+    """
+    Render a history row as an SSE frame
+    """
+    action = dict(TestScoreHistory.ACTION_CHOICES)[row['action']]
+    data = json.dumps({
+        'id': row['score_id'],
+        'student_id': row['student_id'],
+        'test_id': row['test_id'],
+        'score': row['score'],
+        'timestamp': row['timestamp'].isoformat(),
+    })
+    return f'id: {row["id"]}\nevent: score.{action}\ndata: {data}\n\n'
+
+
+class SlowConsumer(Exception):
+    """
+    Raised to a subscriber whose queue overflowed; it should disconnect and
+    let the client resume from its Last-Event-ID
+    """
+
+
+class Subscription:
+    def __init__(self, maxsize, cohort_ids):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.cohort_ids = cohort_ids
+        self.overflowed = False
+        self.closed = False
+        self.last_id = 0
+
+    def offer(self, row, cohort_ids):
+        if self.overflowed or row['id'] <= self.last_id or not cohort_ids & self.cohort_ids:
+            return
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Backpressure: rather than buffer without bound, cut the client
+            # loose; it will reconnect and replay from the database.
+            self.overflowed = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            # get() does not wait while rows are queued
+            pass
+
+    async def get(self, timeout):
+        """
+        Next row for this subscriber, or None once the subscription is closed
+        """
+        while True:
+            if self.overflowed:
+                raise SlowConsumer
+            if self.closed:
+                return None
+            row = await asyncio.wait_for(self.queue.get(), timeout)
+            if row is None:
+                continue
+            # Rows already sent during a Last-Event-ID replay are skipped
+            if row['id'] > self.last_id:
+                self.last_id = row['id']
+                return row
+
+
+class ScoreEventBroker:
+    def __init__(self, loop):
+        self.loop = loop
+        self.subscribers = set()
+        self.wakeup = asyncio.Event()
+        self.poller = None
+        self.last_id = None
+
+    def subscribe(self, cohort_ids):
+        subscription = Subscription(settings.SCORE_EVENTS_QUEUE_SIZE, cohort_ids)
+        self.subscribers.add(subscription)
+        if self.poller is None or self.poller.done():
+            self.poller = self.loop.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def _poll(self):
+        self.last_id = None
+        failures = 0
+        while self.subscribers:
+            try:
+                caught_up = await self._poll_once()
+            except Exception:
+                # E.g. the database is locked by a purge; subscribers keep their
+                # streams and get the missed rows once polling recovers
+                failures += 1
+                delay = min(settings.SCORE_EVENTS_POLL_INTERVAL * 2 ** failures, POLL_RETRY_MAX_DELAY)
+                logger.exception('Polling score events failed, retrying in %.1f s', delay)
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            if not caught_up:
+                continue
+            if not self.subscribers:
+                break
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), settings.SCORE_EVENTS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_once(self):
+        """
+        Push rows written since the last poll; False if more are waiting
+        """
+        if self.last_id is None:
+            self.last_id = await sync_to_async(_latest_id)()
+        rows = await sync_to_async(_fetch_after)(self.last_id, settings.SCORE_EVENTS_QUEUE_SIZE)
+        if not rows:
+            return True
+        cohorts = await sync_to_async(_student_cohorts)({row['student_id'] for row in rows})
+        for row in rows:
+            row_cohorts = cohorts.get(row['student_id'], set())
+            for subscription in list(self.subscribers):
+                subscription.offer(row, row_cohorts)
+        self.last_id = rows[-1]['id']
+        return len(rows) < settings.SCORE_EVENTS_QUEUE_SIZE
+
+
+def get_broker():
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(loop)
+    if broker is None:
+        broker = _brokers[loop] = ScoreEventBroker(loop)
+    return broker
+
+
+def notify_score_changed():
+    """
+    Wake the pollers in this process; safe to call from sync code in any thread
+    """
+    for loop, broker in list(_brokers.items()):
+        if not loop.is_closed() and broker.subscribers:
+            broker.notify()
+
+
+def end_streams():
+    """
+    End every open event stream in this process so a stopping worker need not
+    wait for them; clients reconnect elsewhere and resume from Last-Event-ID.
+    Call from the event loop.
+    """
+    for broker in list(_brokers.values()):
+        for subscription in list(broker.subscribers):
+            subscription.close()
+
+
+async def stream_score_events(cohort_ids, last_event_id=None):
+    """
+    Async iterator of SSE frames for students in cohort_ids (a set): missed
+    events since last_event_id, then live events
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(cohort_ids)
+    try:
+        yield f'retry: {settings.SCORE_EVENTS_RETRY_MS}\n\n'
+        if last_event_id is not None:
+            # Subscribed first, so anything written during the replay is queued
+            # and deduplicated by id rather than lost
+            while True:
+                rows = await sync_to_async(_fetch_after)(last_event_id, 500, list(cohort_ids))
+                for row in rows:
+                    subscription.last_id = row['id']
+                    yield format_event(row)
+                if len(rows) < 500:
+                    break
+                last_event_id = rows[-1]['id']
+        while True:
+            try:
+                row = await subscription.get(settings.SCORE_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            except SlowConsumer:
+                return
+            if row is None:
+                return
+            yield format_event(row)
+    finally:
+        broker.unsubscribe(subscription)
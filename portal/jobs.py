@@ -0,0 +1,277 @@
+import csv
+import logging
+import os
+import signal
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidate_tests
+from .cohorts import cohort_student_ids, mentor_cohort_ids
+from .models import Job, MentorProfile, Test, TestScore
+
+logger = logging.getLogger('portal.jobs')
+
+# Longest pause, in seconds, after repeated errors in the worker loop
+ERROR_RETRY_MAX_DELAY = 30
+
+# kind -> callable(job, report_progress) returning a JSON-serializable result
+JOB_HANDLERS = {}
+
+
+def register(kind):
+    """
+    Register a function as the handler for jobs of the given kind
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def submit(kind, payload=None, user=None, max_attempts=None):
+    """
+    Queue a job and return it; workers pick it up on their next poll
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind "{kind}"')
+    job = Job(kind=kind, payload=payload or {}, created_by=user)
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+def claim_next(worker_id):
+    """
+    Atomically move the oldest runnable job to RUNNING and return it.
+
+    The conditional UPDATE only succeeds for one worker per job, so this is
+    safe across processes without row locks (which SQLite does not have).
+    """
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.STATUS_PENDING, run_after__lte=now)
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(id=job_id, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def requeue_stale_jobs():
+    """
+    Release jobs whose worker died mid-run (no heartbeat within JOB_LOCK_TIMEOUT)
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, error='Worker lost while running job',
+        locked_by='', locked_at=None, updated_at=now,
+    )
+    requeued = stale.update(
+        status=Job.STATUS_PENDING, locked_by='', locked_at=None, run_after=now, updated_at=now,
+    )
+    return requeued, failed
+
+
+class ClaimLost(Exception):
+    """
+    Raised by report_progress when the job was requeued and possibly claimed
+    by another worker, so the handler stops instead of racing it
+    """
+
+
+def run_job(job):
+    """
+    Execute a claimed job and record its outcome, scheduling a retry on failure.
+
+    Every update is conditional on this worker still holding the claim, so a
+    worker whose job was requeued as stale cannot overwrite the new run.
+    """
+    claimed = Job.objects.filter(id=job.id, status=Job.STATUS_RUNNING, locked_by=job.locked_by)
+
+    def report_progress(percent, message=''):
+        now = timezone.now()
+        if not claimed.update(
+            progress=max(0, min(100, int(percent))),
+            progress_message=message[:255],
+            locked_at=now,
+            updated_at=now,
+        ):
+            raise ClaimLost(job.id)
+
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        claimed.update(
+            status=Job.STATUS_FAILED, error=f'Unknown job kind "{job.kind}"',
+            locked_by='', locked_at=None, updated_at=timezone.now(),
+        )
+        return
+
+    try:
+        result = handler(job, report_progress)
+    except ClaimLost:
+        logger.warning('Job %s was requeued while %s was running it; abandoning this run', job.id, job.locked_by)
+        return
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            # Exponential backoff: 2s, 4s, 8s, ...
+            claimed.update(
+                status=Job.STATUS_PENDING, error=error,
+                run_after=now + timedelta(seconds=2 ** job.attempts),
+                locked_by='', locked_at=None, updated_at=now,
+            )
+        else:
+            claimed.update(
+                status=Job.STATUS_FAILED, error=error,
+                locked_by='', locked_at=None, updated_at=now,
+            )
+        return
+
+    if not claimed.update(
+        status=Job.STATUS_SUCCEEDED, result=result, progress=100, error='',
+        locked_by='', locked_at=None, updated_at=timezone.now(),
+    ):
+        logger.warning('Job %s was requeued while %s was running it; result discarded', job.id, job.locked_by)
+
+
+def work(worker_id, poll_interval=1.0, burst=False, stop_event=None):
+    """
+    Worker loop: claim and run jobs until stopped (or until the queue is empty in burst mode)
+    """
+    if stop_event is not None:
+        # The parent process coordinates shutdown through stop_event
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def pause(seconds):
+        if stop_event is not None:
+            stop_event.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    last_recovery = 0.0
+    failures = 0
+    while stop_event is None or not stop_event.is_set():
+        try:
+            close_old_connections()
+            if time.monotonic() - last_recovery > settings.JOB_LOCK_TIMEOUT / 2:
+                requeue_stale_jobs()
+                last_recovery = time.monotonic()
+
+            job = claim_next(worker_id)
+            if job is not None:
+                run_job(job)
+        except Exception:
+            # e.g. "database is locked" while other processes write; a job
+            # left RUNNING here is requeued once its heartbeat goes stale
+            failures += 1
+            delay = min(poll_interval * 2 ** failures, ERROR_RETRY_MAX_DELAY)
+            logger.exception('Worker %s failed, retrying in %.1fs', worker_id, delay)
+            pause(delay)
+            continue
+        failures = 0
+        if job is None:
+            if burst:
+                return
+            pause(poll_interval)
+
+
+def purge_test(test_id, batch_size=None, report_progress=None):
+    """
+    Delete a hidden test's scores in bounded batches, then the test itself.
+
+    Each batch is its own short transaction so other writers are never locked
+    out for long, and only one batch of ids is held in memory at a time.
+    """
+    batch_size = batch_size or settings.TEST_PURGE_BATCH_SIZE
+    scores = TestScore.all_objects.filter(test_id=test_id)
+    total = scores.count()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(scores.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += TestScore.all_objects.filter(id__in=ids).delete()[0]
+        if report_progress is not None and total:
+            report_progress(min(99, deleted * 100 // total), f'{deleted}/{total} scores deleted')
+    Test.all_objects.filter(id=test_id, is_hidden=True).delete()
+    return deleted
+
+
+def job_cohort_ids(job):
+    """
+    Cohorts an export job may read: the submitting mentor's, narrowed to
+    payload['cohort_id'] if given. None means every cohort, for jobs queued
+    outside the API without a cohort_id.
+    """
+    cohort_id = job.payload.get('cohort_id')
+    mentor_profile = MentorProfile.objects.filter(user_id=job.created_by_id).first() if job.created_by_id else None
+    if mentor_profile is not None:
+        return mentor_cohort_ids(mentor_profile, cohort_id)
+    return [cohort_id] if cohort_id is not None else None
+
+
+@register('delete_test')
+def delete_test_job(job, report_progress):
+    test_id = job.payload['test_id']
+    # Hide first in case the job was submitted directly rather than via the API
+    if Test.all_objects.filter(id=test_id, is_hidden=False).update(is_hidden=True):
+        invalidate_tests()
+    deleted = purge_test(test_id, report_progress=report_progress)
+    return {'test_id': test_id, 'scores_deleted': deleted}
+
+
+@register('export_scores')
+def export_scores_job(job, report_progress):
+    os.makedirs(settings.JOB_EXPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.JOB_EXPORT_DIR, f'scores-{job.id}.csv')
+
+    scores = TestScore.objects.order_by('id').values_list(
+        'id', 'student_id', 'student__user__username', 'test_id', 'test__name', 'score', 'date_taken',
+    )
+    test_id = job.payload.get('test_id')
+    if test_id is not None:
+        scores = scores.filter(test_id=test_id)
+    cohort_ids = job_cohort_ids(job)
+    if cohort_ids is not None:
+        scores = scores.filter(student_id__in=cohort_student_ids(cohort_ids))
+    total = scores.count()
+
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'student_id', 'username', 'test_id', 'test_name', 'score', 'date_taken'])
+        for row in scores.iterator(chunk_size=2000):
+            writer.writerow(row)
+            rows += 1
+            if rows % 2000 == 0:
+                report_progress(rows * 100 // total, f'{rows}/{total} rows written')
+    return {'path': path, 'rows': rows}
+
+
+@register('score_snapshot')
+def score_snapshot_job(job, report_progress):
+    from .snapshot import write_snapshot
+
+    directory = os.path.join(settings.JOB_EXPORT_DIR, f'snapshot-{job.id}')
+    rows = write_snapshot(directory, report_progress=report_progress, cohort_ids=job_cohort_ids(job))
+    return {'path': directory, 'rows': rows}
@@ -0,0 +1,65 @@
+import csv
+import gzip
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from portal.models import TestScoreHistory
+
+
+class Command(BaseCommand):
+    help = ('Move score history entries older than the retention window into '
+            'monthly gzipped CSV archives and delete them from the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.SCORE_HISTORY_RETENTION_DAYS,
+                            help='Archive entries older than this many days')
+        parser.add_argument('--archive-dir', default=settings.SCORE_HISTORY_ARCHIVE_DIR,
+                            help='Directory for score-history-YYYY-MM.csv.gz files')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Entries archived and deleted per transaction')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        archive_dir = options['archive_dir']
+        batch_size = options['batch_size']
+        os.makedirs(archive_dir, exist_ok=True)
+
+        old_entries = TestScoreHistory.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id')
+        archived = 0
+        while True:
+            batch = list(old_entries.values_list(
+                'id', 'timestamp', 'action', 'score_id', 'student_id', 'test_id', 'score',
+            )[:batch_size])
+            if not batch:
+                break
+
+            by_month = {}
+            for row in batch:
+                by_month.setdefault(row[1].strftime('%Y-%m'), []).append(row)
+            for month, rows in by_month.items():
+                self._append(os.path.join(archive_dir, f'score-history-{month}.csv.gz'), rows)
+
+            # Rows are deleted only after they are safely on disk; a crash in
+            # between can at worst duplicate a batch in the archive.
+            with transaction.atomic():
+                TestScoreHistory.objects.filter(id__in=[row[0] for row in batch]).delete()
+            archived += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} history entries older than {cutoff:%Y-%m-%d} to {archive_dir}'
+        ))
+
+    def _append(self, path, rows):
+        is_new = not os.path.exists(path)
+        # Appending a new gzip member keeps earlier members readable as one stream
+        with gzip.open(path, 'at', newline='') as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(['id', 'timestamp', 'action', 'score_id', 'student_id', 'test_id', 'score'])
+            for row in rows:
+                writer.writerow([row[0], row[1].isoformat(), *row[2:]])
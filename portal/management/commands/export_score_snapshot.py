@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.models import Cohort
+from portal.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Write a columnar NumPy snapshot of all test scores, plus student and '
+            'test lookup tables, for offline analytics (load with portal.snapshot.load_snapshot)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory to write the snapshot into')
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help='Rows fetched from the database per query')
+        parser.add_argument('--cohort', action='append', metavar='CODE',
+                            help='Only export this cohort (repeatable); default is every cohort')
+
+    def handle(self, *args, **options):
+        cohort_ids = None
+        if options['cohort']:
+            cohorts = dict(Cohort.objects.filter(code__in=options['cohort']).values_list('code', 'id'))
+            missing = set(options['cohort']) - set(cohorts)
+            if missing:
+                raise CommandError(f'Unknown cohort code(s): {", ".join(sorted(missing))}')
+            cohort_ids = list(cohorts.values())
+        rows = write_snapshot(options['output_dir'], chunk_size=options['chunk_size'], cohort_ids=cohort_ids)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} scores to {options["output_dir"]}'))
@@ -0,0 +1,78 @@
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from portal.jobs import work
+
+# A worker dying sooner than this after starting is restarted only after this delay
+MIN_WORKER_UPTIME = 1.0
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers for the portal job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKER_PROCESSES,
+                            help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        if processes == 1:
+            self.stdout.write(f'Starting worker {prefix}')
+            work(prefix, poll_interval=poll_interval, burst=burst)
+            return
+
+        # Children must open their own database connections
+        connections.close_all()
+        ctx = multiprocessing.get_context('fork')
+        stop_event = ctx.Event()
+        worker_ids = (f'{prefix}-{i}' for i in itertools.count())
+        workers = {}
+
+        def spawn():
+            worker_id = next(worker_ids)
+            worker = ctx.Process(target=work, args=(worker_id, poll_interval, burst, stop_event), daemon=True)
+            worker.start()
+            workers[worker] = (worker_id, time.monotonic())
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping workers after their current job...')
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        for _ in range(processes):
+            spawn()
+        self.stdout.write(f'Started {processes} workers ({prefix})')
+        while workers and not stop_event.is_set():
+            ready = multiprocessing.connection.wait([w.sentinel for w in workers], timeout=1)
+            for worker in [w for w in workers if w.sentinel in ready]:
+                worker_id, started = workers.pop(worker)
+                worker.join()
+                if stop_event.is_set() or (burst and worker.exitcode == 0):
+                    continue
+                # Keep the pool at full size when a worker dies
+                self.stderr.write(f'Worker {worker_id} exited with code {worker.exitcode}, restarting')
+                if time.monotonic() - started < MIN_WORKER_UPTIME:
+                    time.sleep(MIN_WORKER_UPTIME)
+                spawn()
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS('All workers stopped'))
@@ -0,0 +1,273 @@
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from portal.cache import invalidate_tests
+from portal.cohorts import CohortMentor, CohortStudent, CohortTest
+from portal.models import StudentProfile, MentorProfile, Test, TestScore, TestScoreHistory, ChangeLogEntry, Cohort
+
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Akash', 'Ananya', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Meera', 'Neha',
+    'Nikhil', 'Pooja', 'Priya', 'Rahul', 'Rohan', 'Sanjana', 'Shreya', 'Siddharth', 'Tanvi', 'Varun',
+]
+LAST_NAMES = [
+    'Bhat', 'Das', 'Gupta', 'Hegde', 'Iyer', 'Joshi', 'Kamath', 'Kumar', 'Menon', 'Nair',
+    'Pai', 'Patel', 'Rao', 'Reddy', 'Shetty', 'Singh', 'Shah', 'Verma',
+]
+TOPICS = [
+    'Arrays', 'Strings', 'Linked Lists', 'Stacks and Queues', 'Trees', 'Graphs', 'Dynamic Programming',
+    'Greedy Algorithms', 'Recursion', 'Sorting', 'Binary Search', 'Hashing', 'SQL', 'Operating Systems',
+    'Computer Networks', 'System Design', 'Object Oriented Design', 'Python', 'JavaScript', 'Git',
+]
+EXPERTISE = ['Backend', 'Frontend', 'Data Structures', 'Algorithms', 'Databases', 'DevOps', 'Machine Learning']
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a deterministic synthetic dataset of cohorts, users, '
+            'profiles, tokens, tests and test scores for scale testing')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--mentors', type=int, default=20)
+        parser.add_argument('--tests', type=int, default=50)
+        parser.add_argument('--scores-per-student', type=int, default=20,
+                            help="Distinct tests each student has a score for (capped at their cohort's tests)")
+        parser.add_argument('--cohorts', type=int, default=1,
+                            help='Students, mentors and tests are dealt round-robin into this many cohorts')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='The same seed always generates the same rows')
+        parser.add_argument('--prefix', default='scale',
+                            help='Username prefix, so several datasets can live in one database')
+        parser.add_argument('--password', default='password',
+                            help='Password for every generated user')
+        parser.add_argument('--until', default='2025-09-01',
+                            help='Latest date a test or score is dated (YYYY-MM-DD); data spans the year before it')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Students (with their users, tokens and scores) written per transaction')
+        parser.add_argument('--track-changes', action='store_true',
+                            help='Also write change log and score history entries, which bulk '
+                                 'inserts otherwise skip because they bypass model signals')
+
+    def handle(self, *args, **options):
+        self.seed = options['seed']
+        self.prefix = options['prefix']
+        self.track_changes = options['track_changes']
+        batch_size = options['batch_size']
+        if batch_size < 1 or options['cohorts'] < 1:
+            raise CommandError('--batch-size and --cohorts must be at least 1')
+        try:
+            self.until = datetime.strptime(options['until'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            raise CommandError('--until must be a date in YYYY-MM-DD format')
+        self.since = self.until - timedelta(days=365)
+        if User.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f'Users prefixed "{self.prefix}_" already exist; pick another --prefix')
+
+        # Hashing is deliberately slow, so every user shares one precomputed hash
+        self.password_hash = make_password(options['password'], salt=f'seedscale{self.seed}')
+        started = time.monotonic()
+
+        self.cohort_ids = self.create_cohorts(options['cohorts'])
+        tests = self.create_tests(options['tests'])
+        self.stdout.write(f'Created {len(self.cohort_ids)} cohorts and {len(tests)} tests')
+        cohort_tests = [tests[i::len(self.cohort_ids)] for i in range(len(self.cohort_ids))]
+
+        for start in range(0, options['mentors'], batch_size):
+            stop = min(start + batch_size, options['mentors'])
+            self.create_mentors(range(start, stop))
+        self.stdout.write(f'Created {options["mentors"]} mentors')
+
+        self.score_count = 0
+        for start in range(0, options['students'], batch_size):
+            stop = min(start + batch_size, options['students'])
+            self.create_students(range(start, stop), cohort_tests, options['scores_per_student'])
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Created {stop}/{options["students"]} students ({elapsed:.1f}s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {options["students"]} students, {options["mentors"]} mentors, {len(tests)} tests and '
+            f'{self.score_count} scores in {time.monotonic() - started:.1f}s'
+        ))
+
+    def rng(self, kind, index):
+        # One generator per row, so the output does not depend on --batch-size
+        return random.Random(f'{self.seed}:{kind}:{index}')
+
+    def make_user(self, rng, username):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        return User(
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            email=f'{username}@example.com',
+            password=self.password_hash,
+            date_joined=self.since + timedelta(seconds=rng.randrange(365 * 86400)),
+        )
+
+    def create_users(self, users):
+        """
+        Bulk insert users and one token each, returning them with ids set
+        """
+        User.objects.bulk_create(users)
+        if users and users[0].pk is None:
+            # Backends that cannot return ids from bulk inserts
+            ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'id'))
+            for user in users:
+                user.pk = user.id = ids[user.username]
+        # Usernames include the prefix, so keys stay unique across datasets with the same seed
+        Token.objects.bulk_create([
+            Token(key=hashlib.sha1(f'{self.seed}:{user.username}'.encode()).hexdigest(), user=user)
+            for user in users
+        ])
+        return users
+
+    def fill_profile_ids(self, model, profiles):
+        if profiles and profiles[0].pk is None:
+            ids = dict(model.objects.filter(user__in=[p.user_id for p in profiles]).values_list('user_id', 'id'))
+            for profile in profiles:
+                profile.pk = profile.id = ids[profile.user_id]
+
+    def cohort_of(self, index):
+        return self.cohort_ids[index % len(self.cohort_ids)]
+
+    def create_cohorts(self, count):
+        cohorts = Cohort.objects.bulk_create([
+            Cohort(name=f'{self.prefix.title()} Cohort {index + 1}', code=f'{self.prefix}-{index + 1}')
+            for index in range(count)
+        ])
+        if cohorts[0].pk is None:
+            return list(Cohort.objects.filter(code__startswith=f'{self.prefix}-').order_by('id').values_list('id', flat=True))
+        return [cohort.id for cohort in cohorts]
+
+    def create_tests(self, count):
+        tests = []
+        for index in range(count):
+            rng = self.rng('test', index)
+            topic = TOPICS[index % len(TOPICS)]
+            tests.append(Test(
+                name=f'{topic} Assessment {index // len(TOPICS) + 1}',
+                description=f'Timed assessment covering {topic.lower()}.',
+                created_at=self.since + timedelta(seconds=rng.randrange(300 * 86400)),
+            ))
+        with transaction.atomic():
+            Test.all_objects.bulk_create(tests, batch_size=1000)
+            if tests and tests[0].pk is None:
+                tests = list(Test.all_objects.order_by('-id')[:count])[::-1]
+            CohortTest.objects.bulk_create([
+                CohortTest(cohort_id=self.cohort_of(index), test_id=test.id) for index, test in enumerate(tests)
+            ], batch_size=5000)
+            if self.track_changes:
+                self.log_changes('test', [(test.id, None) for test in tests])
+        invalidate_tests()
+        # Harder tests pull every student's score down
+        return [(test, self.rng('test', index).gauss(0, 8)) for index, test in enumerate(tests)]
+
+    def create_mentors(self, indexes):
+        rngs = [self.rng('mentor', index) for index in indexes]
+        with transaction.atomic():
+            users = self.create_users(
+                [self.make_user(rng, f'{self.prefix}_mentor_{index:06d}') for index, rng in zip(indexes, rngs)],
+            )
+            profiles = MentorProfile.objects.bulk_create([
+                MentorProfile(
+                    user=user,
+                    expertise=rng.choice(EXPERTISE),
+                    github=f'https://github.com/{user.username}',
+                    bio=f'{user.first_name} mentors students in {rng.choice(TOPICS).lower()}.',
+                )
+                for user, rng in zip(users, rngs)
+            ])
+            self.fill_profile_ids(MentorProfile, profiles)
+            CohortMentor.objects.bulk_create([
+                CohortMentor(cohort_id=self.cohort_of(index), mentorprofile_id=profile.id)
+                for index, profile in zip(indexes, profiles)
+            ])
+            if self.track_changes:
+                self.log_changes('mentor', [(profile.id, None) for profile in profiles])
+
+    def create_students(self, indexes, cohort_tests, per_student):
+        rngs = [self.rng('student', index) for index in indexes]
+        with transaction.atomic():
+            users = self.create_users(
+                [self.make_user(rng, f'{self.prefix}_student_{index:07d}') for index, rng in zip(indexes, rngs)],
+            )
+            profiles = StudentProfile.objects.bulk_create([
+                StudentProfile(
+                    user=user,
+                    leetcode=f'https://leetcode.com/{user.username}',
+                    github=f'https://github.com/{user.username}',
+                )
+                for user in users
+            ])
+            self.fill_profile_ids(StudentProfile, profiles)
+            CohortStudent.objects.bulk_create([
+                CohortStudent(cohort_id=self.cohort_of(index), studentprofile_id=profile.id)
+                for index, profile in zip(indexes, profiles)
+            ], batch_size=5000)
+
+            rows = []
+            for index, profile, rng in zip(indexes, profiles, rngs):
+                ability = rng.gauss(68, 12)
+                tests = cohort_tests[index % len(cohort_tests)]
+                for test, difficulty in rng.sample(tests, min(per_student, len(tests))):
+                    window = (self.until - test.created_at).total_seconds()
+                    rows.append((
+                        profile.id,
+                        test.id,
+                        min(100, max(0, round(ability - difficulty + rng.gauss(0, 8)))),
+                        test.created_at + timedelta(seconds=rng.uniform(0, window)),
+                    ))
+            self.insert_scores(rows)
+            self.score_count += len(rows)
+
+            if self.track_changes:
+                self.log_changes('student', [(profile.id, profile.id) for profile in profiles])
+                scores = list(TestScore.all_objects.filter(student_id__in=[p.id for p in profiles]).values_list(
+                    'id', 'student_id', 'test_id', 'score', 'date_taken',
+                ))
+                self.log_changes('test_score', [(score[0], score[1]) for score in scores])
+                TestScoreHistory.objects.bulk_create([
+                    TestScoreHistory(
+                        timestamp=date_taken,
+                        action=TestScoreHistory.ACTION_CREATED,
+                        score_id=score_id,
+                        student_id=student_id,
+                        test_id=test_id,
+                        score=score,
+                    )
+                    for score_id, student_id, test_id, score, date_taken in scores
+                ], batch_size=5000)
+
+    def insert_scores(self, rows):
+        """
+        Scores far outnumber every other row, so they skip bulk_create's
+        per-field preparation and go straight to executemany
+        """
+        ops = connection.ops
+        columns = ', '.join(
+            ops.quote_name(TestScore._meta.get_field(name).column)
+            for name in ('student', 'test', 'score', 'date_taken', 'updated_at')
+        )
+        sql = f'INSERT INTO {ops.quote_name(TestScore._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s, %s)'
+        now = ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), 5000):
+                cursor.executemany(sql, [
+                    (student_id, test_id, score, ops.adapt_datetimefield_value(date_taken), now)
+                    for student_id, test_id, score, date_taken in rows[start:start + 5000]
+                ])
+
+    def log_changes(self, model, rows):
+        ChangeLogEntry.objects.bulk_create([
+            ChangeLogEntry(model=model, object_id=object_id, action=ChangeLogEntry.ACTION_CREATED, student_id=student_id)
+            for object_id, student_id in rows
+        ], batch_size=5000)
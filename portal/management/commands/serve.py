@@ -0,0 +1,350 @@
+import asyncio
+import gc
+import logging
+import multiprocessing
+import multiprocessing.connection
+import random
+import signal
+import socket
+import time
+from contextlib import contextmanager
+
+import uvicorn
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from django.core.asgi import get_asgi_application
+from django.core.cache import close_caches
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from rest_framework import serializers as drf_serializers
+
+from portal.events import end_streams
+
+logger = logging.getLogger('uvicorn.error')
+
+# A worker failing sooner than this after starting is restarted only after this delay
+MIN_WORKER_UPTIME = 1.0
+
+
+def warm_url_resolver(resolver):
+    """
+    Compile every URL pattern's regex and build the reverse lookup tables
+    """
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            warm_url_resolver(pattern)
+    resolver.reverse_dict
+    return resolver
+
+
+def warm_serializers():
+    """
+    Build the field set of every portal serializer, which also fills the
+    models' _meta caches
+    """
+    from portal import serializers
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+    count = 0
+    for value in vars(serializers).values():
+        if (isinstance(value, type) and issubclass(value, drf_serializers.Serializer)
+                and value.__module__ == serializers.__name__):
+            value().fields
+            count += 1
+    return count
+
+
+def warm_test_cache():
+    from portal.cache import test_cache
+    from portal.models import Test
+
+    ids = list(Test.objects.order_by('-id').values_list('id', flat=True)[:settings.TEST_CACHE_SIZE])
+    return len(test_cache.get_many(ids))
+
+
+WARMUP_PATH = '/portal/tests/'
+
+
+def warmup_host():
+    return next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+
+
+@contextmanager
+def quiet_request_log():
+    # Warm-up requests are refused for lack of credentials; keep that out of the log
+    request_logger = logging.getLogger('django.request')
+    request_logger.disabled = True
+    try:
+        yield
+    finally:
+        request_logger.disabled = False
+
+
+def warm_request():
+    """
+    Send one unauthenticated request through the full middleware and DRF
+    stack so lazily imported and lazily built pieces are ready before fork
+    """
+    from django.test import Client
+
+    with quiet_request_log():
+        return Client(HTTP_HOST=warmup_host()).get(WARMUP_PATH).status_code
+
+
+async def warm_asgi_request(app, path=WARMUP_PATH):
+    """
+    Send one unauthenticated request through the ASGI application. Run in
+    each worker before it accepts connections: the first request after fork
+    copies the shared pages it writes to, which would otherwise add several
+    milliseconds to the first real request.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '', 'headers': [(b'host', warmup_host().encode())],
+        'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 0),
+    }
+    request_sent = False
+    status_code = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Nothing more to read; the handler cancels this once the response is sent
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status_code
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+
+    with quiet_request_log():
+        await app(scope, receive, send)
+    return status_code
+
+
+def warm_server_modules(app):
+    """
+    Import the HTTP protocol and lifespan implementations uvicorn would
+    otherwise import in every worker
+    """
+    config = uvicorn.Config(app, interface='asgi3', lifespan='on', log_config=None)
+    config.load()
+    return config.http_protocol_class.__name__
+
+
+def get_application():
+    app = get_asgi_application()
+    if settings.SERVER_SERVE_STATIC:
+        # With DEBUG off Django serves no static files, so /admin/ would come without its CSS
+        app = ASGIStaticFilesHandler(app)
+    return app
+
+
+class WorkerApplication:
+    """
+    Wraps the Django ASGI application with lifespan events. On startup the
+    worker serves itself one request; uvicorn only starts accepting
+    connections afterwards. Database connections are opened per request:
+    Django runs each request's sync code in a thread of its own, so a
+    connection opened here or kept open by CONN_MAX_AGE would not be reused.
+    """
+
+    def __init__(self, app, forked_at, warmup=True):
+        self.app = app
+        self.forked_at = forked_at
+        self.warmup = warmup
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.warmup:
+                    await warm_asgi_request(self.app)
+                logger.info('Worker ready in %.0f ms', (time.monotonic() - self.forked_at) * 1000)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+class WorkerServer(uvicorn.Server):
+    async def shutdown(self, sockets=None):
+        # Event streams never finish by themselves; end them so the graceful
+        # timeout only waits for ordinary requests
+        end_streams()
+        await super().shutdown(sockets)
+
+
+def run_worker(app, sock, forked_at, options):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+    # Reloads are the master's business; workers only stop when told to
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    max_requests = options['max_requests']
+    if max_requests:
+        max_requests += random.randint(0, max(0, options['max_requests_jitter']))
+    config = uvicorn.Config(
+        WorkerApplication(app, forked_at, warmup=not options['no_warmup']),
+        interface='asgi3',
+        lifespan='on',
+        limit_max_requests=max_requests or None,
+        timeout_graceful_shutdown=options['graceful_timeout'],
+        backlog=options['backlog'],
+        access_log=options['access_log'],
+    )
+    WorkerServer(config).run(sockets=[sock])
+
+
+class Command(BaseCommand):
+    help = 'Serve the portal with pre-forked uvicorn workers, warmed up before forking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--workers', type=int, default=settings.SERVER_WORKERS,
+                            help='Number of worker processes')
+        parser.add_argument('--max-requests', type=int, default=settings.SERVER_MAX_REQUESTS,
+                            help='Requests a worker serves before it is replaced (0 never)')
+        parser.add_argument('--max-requests-jitter', type=int, default=settings.SERVER_MAX_REQUESTS_JITTER,
+                            help='Up to this many extra requests, chosen per worker')
+        parser.add_argument('--graceful-timeout', type=int, default=settings.SERVER_GRACEFUL_TIMEOUT,
+                            help='Seconds a stopping worker waits for open requests')
+        parser.add_argument('--backlog', type=int, default=2048)
+        parser.add_argument('--access-log', action='store_true', help='Log every request')
+        parser.add_argument('--no-warmup', action='store_true',
+                            help='Skip warm-up; only import the application before forking')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        app = self.preload(warmup=not options['no_warmup'])
+        self.stdout.write(f'Preloaded in {(time.monotonic() - started) * 1000:.0f} ms')
+
+        sock = socket.socket(socket.AF_INET6 if ':' in options['host'] else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((options['host'], options['port']))
+        sock.listen(options['backlog'])
+
+        # Objects created so far are shared with workers; keep the collector
+        # from touching them so their pages stay shared after fork
+        gc.collect()
+        gc.freeze()
+
+        self.ctx = multiprocessing.get_context('fork')
+        self.app = app
+        self.sock = sock
+        self.options = options
+        self.workers = {}
+        # Replaced workers finishing their open requests, with kill deadlines
+        self.retiring = {}
+        self.reload_requested = False
+        self.stopping = False
+
+        def stop(signum, frame):
+            self.stopping = True
+
+        def reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGHUP, reload)
+
+        workers = max(1, options['workers'])
+        for _ in range(workers):
+            self.spawn()
+        self.stdout.write(f'Listening on {options["host"]}:{options["port"]} with {workers} workers')
+
+        while not self.stopping:
+            sentinels = [w.sentinel for w in [*self.workers, *self.retiring]]
+            ready = multiprocessing.connection.wait(sentinels, timeout=0.5)
+            for worker in [w for w in self.workers if w.sentinel in ready]:
+                self.replace(worker)
+            self.reap_retiring()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+
+        self.shutdown()
+
+    def preload(self, warmup):
+        app = get_application()
+        steps = [] if not warmup else [
+            ('URL resolver', lambda: len(warm_url_resolver(get_resolver()).reverse_dict)),
+            ('serializers', warm_serializers),
+            ('test cache', warm_test_cache),
+            ('request', warm_request),
+            ('server modules', lambda: warm_server_modules(app)),
+        ]
+        for name, step in steps:
+            start = time.monotonic()
+            result = step()
+            self.stdout.write(f'  warmed {name} ({result}) in {(time.monotonic() - start) * 1000:.0f} ms')
+        # Connections and their sockets must not be shared across fork
+        connections.close_all()
+        close_caches()
+        return app
+
+    def spawn(self):
+        worker = self.ctx.Process(target=run_worker, args=(self.app, self.sock, time.monotonic(), self.options),
+                                  daemon=True)
+        worker.start()
+        self.workers[worker] = time.monotonic()
+        return worker
+
+    def replace(self, worker):
+        started = self.workers.pop(worker)
+        worker.join()
+        if self.stopping:
+            return
+        if worker.exitcode:
+            self.stderr.write(f'Worker {worker.pid} exited with code {worker.exitcode}')
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                # Failing on startup; do not respawn in a tight loop
+                time.sleep(MIN_WORKER_UPTIME)
+        self.spawn()
+
+    def rolling_restart(self):
+        """
+        Start a replacement for each worker, then ask the old one to finish
+        its open requests and exit. Workers are forked from the preloaded
+        master, so code changes need a full restart.
+        """
+        self.stdout.write('Replacing workers')
+        deadline = time.monotonic() + self.options['graceful_timeout'] + 5
+        for old in list(self.workers):
+            self.spawn()
+            self.workers.pop(old)
+            old.terminate()
+            self.retiring[old] = deadline
+
+    def reap_retiring(self):
+        now = time.monotonic()
+        for worker, deadline in list(self.retiring.items()):
+            if worker.is_alive() and now >= deadline:
+                worker.kill()
+            if not worker.is_alive():
+                worker.join()
+                del self.retiring[worker]
+
+    def shutdown(self):
+        self.stdout.write('Stopping workers after their open requests...')
+        deadline = time.monotonic() + self.options['graceful_timeout'] + 5
+        for worker in self.workers:
+            worker.terminate()
+            self.retiring[worker] = deadline
+        for worker in self.retiring:
+            worker.join(max(0, self.retiring[worker] - time.monotonic()))
+            if worker.is_alive():
+                worker.kill()
+                worker.join()
+        self.sock.close()
+        self.stdout.write(self.style.SUCCESS('Server stopped'))
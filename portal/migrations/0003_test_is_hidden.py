@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0002_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='is_hidden',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
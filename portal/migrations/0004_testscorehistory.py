@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0003_test_is_hidden'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestScoreHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'created'), (2, 'updated'), (3, 'deleted')])),
+                ('score_id', models.BigIntegerField()),
+                ('student_id', models.BigIntegerField()),
+                ('test_id', models.BigIntegerField()),
+                ('score', models.SmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Test Score History',
+                'verbose_name_plural': 'Test Score History',
+                'indexes': [models.Index(fields=['timestamp', 'student_id'], name='portal_scorehist_ts_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    # Existing rows get a "created" entry so cursor=0 yields a complete initial sync
+    ChangeLogEntry = apps.get_model('portal', 'ChangeLogEntry')
+    sources = [
+        ('student', apps.get_model('portal', 'StudentProfile'), 'id'),
+        ('mentor', apps.get_model('portal', 'MentorProfile'), None),
+        ('test', apps.get_model('portal', 'Test'), None),
+        ('test_score', apps.get_model('portal', 'TestScore'), 'student_id'),
+    ]
+    for model_name, model, student_field in sources:
+        fields = ['id'] + ([student_field] if student_field else [])
+        batch = []
+        for row in model.objects.order_by('id').values_list(*fields).iterator(chunk_size=2000):
+            batch.append(ChangeLogEntry(
+                model=model_name, object_id=row[0], action=1,
+                student_id=row[1] if student_field else None,
+            ))
+            if len(batch) >= 2000:
+                ChangeLogEntry.objects.bulk_create(batch)
+                batch = []
+        ChangeLogEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0004_testscorehistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mentorprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='testscore',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'created'), (2, 'updated'), (3, 'deleted')])),
+                ('student_id', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Change Log Entry',
+                'verbose_name_plural': 'Change Log Entries',
+                'indexes': [models.Index(fields=['student_id', 'id'], name='portal_changelog_student_idx'), models.Index(fields=['model', 'id'], name='portal_changelog_model_idx')],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_default_cohort(apps, schema_editor):
+    # Existing users and tests keep seeing each other through one shared cohort
+    Cohort = apps.get_model('portal', 'Cohort')
+    members = [
+        ('mentors', 'mentorprofile_id', apps.get_model('portal', 'MentorProfile')),
+        ('students', 'studentprofile_id', apps.get_model('portal', 'StudentProfile')),
+        ('tests', 'test_id', apps.get_model('portal', 'Test')),
+    ]
+    if not any(model.objects.exists() for _, _, model in members):
+        return
+    cohort = Cohort.objects.create(name='Default', code='default')
+    for field, column, model in members:
+        through = getattr(Cohort, field).through
+        batch = []
+        for member_id in model.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=2000):
+            batch.append(through(cohort_id=cohort.id, **{column: member_id}))
+            if len(batch) >= 2000:
+                through.objects.bulk_create(batch)
+                batch = []
+        through.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0005_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cohort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('mentors', models.ManyToManyField(blank=True, related_name='cohorts', to='portal.mentorprofile')),
+                ('students', models.ManyToManyField(blank=True, related_name='cohorts', to='portal.studentprofile')),
+                ('tests', models.ManyToManyField(blank=True, related_name='cohorts', to='portal.test')),
+            ],
+            options={
+                'verbose_name': 'Cohort',
+                'verbose_name_plural': 'Cohorts',
+            },
+        ),
+        migrations.RunPython(create_default_cohort, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+import portal.models
+
+
+def fill_mentor_codes(apps, schema_editor):
+    # Existing cohorts, including the migrated default one, get fresh codes
+    # nobody outside their current mentors has seen
+    Cohort = apps.get_model('portal', 'Cohort')
+    for cohort in Cohort.objects.filter(mentor_code__isnull=True):
+        cohort.mentor_code = portal.models.generate_mentor_code()
+        cohort.save(update_fields=['mentor_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0006_cohort'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cohort',
+            name='mentor_code',
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.RunPython(fill_mentor_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cohort',
+            name='mentor_code',
+            field=models.CharField(default=portal.models.generate_mentor_code, max_length=50, unique=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_default_cohort(apps, schema_editor):
+    # The cohort 0006 moved existing data into, or the one default_cohort()
+    # created on first use; both are named 'Default'
+    Cohort = apps.get_model('portal', 'Cohort')
+    codes = {'default', settings.DEFAULT_COHORT_CODE} - {''}
+    cohort = Cohort.objects.filter(code__in=codes, name='Default').order_by('id').first()
+    if cohort is not None:
+        cohort.is_default = True
+        cohort.save(update_fields=['is_default'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0007_cohort_mentor_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cohort',
+            name='is_default',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_default_cohort, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cohort',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('is_default',), name='portal_cohort_single_default'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import secrets
+
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.db import models
@@ -9,6 +11,7 @@ class StudentProfile(models.Model):
     dateJoined = models.DateTimeField(auto_now_add=True)
     photo = models.CharField(max_length=100,blank=True,null=True)
     bio = models.TextField(blank=True,null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     def __str__(self):
         return f'{self.user.username}'
     
@@ -19,13 +22,23 @@ class MentorProfile(models.Model):
     dateJoined = models.DateTimeField(auto_now_add=True)
     photo = models.CharField(max_length=100,blank=True,null=True)
     bio = models.TextField(blank=True,null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     def __str__(self):
         return f'{self.user.username}'
+class VisibleTestManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_hidden=False)
+
 class Test(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when a delete is requested; scores are purged in batches afterwards
+    is_hidden = models.BooleanField(default=False, db_index=True)
+
+    objects = VisibleTestManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
@@ -34,15 +47,160 @@ class Test(models.Model):
         verbose_name = 'Test'
         verbose_name_plural = 'Tests'
 
+class VisibleTestScoreManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(test__is_hidden=False)
+
 class TestScore(models.Model):
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE)
     test = models.ForeignKey(Test, on_delete=models.CASCADE)
     score = models.IntegerField()
     date_taken = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = VisibleTestScoreManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f'{self.student.user.username} - {self.test.name} - {self.score}'
     
     class Meta:
         verbose_name = 'Test Score'
-        verbose_name_plural = 'Test Scores'
\ No newline at end of file
+        verbose_name_plural = 'Test Scores'
+
+class Job(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.kind} #{self.id} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='portal_job_claim_idx'),
+        ]
+
+
+class TestScoreHistory(models.Model):
+    """
+    Append-only log of TestScore changes. Ids are stored as plain integers
+    rather than foreign keys so entries outlive the rows they describe.
+    """
+    ACTION_CREATED = 1
+    ACTION_UPDATED = 2
+    ACTION_DELETED = 3
+    ACTION_CHOICES = [
+        (ACTION_CREATED, 'created'),
+        (ACTION_UPDATED, 'updated'),
+        (ACTION_DELETED, 'deleted'),
+    ]
+
+    timestamp = models.DateTimeField(default=timezone.now)
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES)
+    score_id = models.BigIntegerField()
+    student_id = models.BigIntegerField()
+    test_id = models.BigIntegerField()
+    score = models.SmallIntegerField()
+
+    def __str__(self):
+        return f'{self.get_action_display()} score {self.score_id} at {self.timestamp}'
+
+    class Meta:
+        verbose_name = 'Test Score History'
+        verbose_name_plural = 'Test Score History'
+        indexes = [
+            models.Index(fields=['timestamp', 'student_id'], name='portal_scorehist_ts_idx'),
+        ]
+
+
+
+class ChangeLogEntry(models.Model):
+    """
+    One row per create/update/delete of a synced model. The auto-increment id
+    is the cursor clients pass to /changes/ to fetch only what changed since
+    their last sync; deletions are recorded here since the rows themselves are gone.
+    """
+    ACTION_CREATED = 1
+    ACTION_UPDATED = 2
+    ACTION_DELETED = 3
+    ACTION_CHOICES = [
+        (ACTION_CREATED, 'created'),
+        (ACTION_UPDATED, 'updated'),
+        (ACTION_DELETED, 'deleted'),
+    ]
+
+    timestamp = models.DateTimeField(default=timezone.now)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES)
+    # Owning student for student profiles and scores, so students can be served their own changes
+    student_id = models.BigIntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.model} {self.object_id} {self.get_action_display()}'
+
+    class Meta:
+        verbose_name = 'Change Log Entry'
+        verbose_name_plural = 'Change Log Entries'
+        indexes = [
+            models.Index(fields=['student_id', 'id'], name='portal_changelog_student_idx'),
+            models.Index(fields=['model', 'id'], name='portal_changelog_model_idx'),
+        ]
+
+
+def generate_mentor_code():
+    return secrets.token_urlsafe(12)
+
+
+class Cohort(models.Model):
+    """
+    A school or class sharing the deployment. Mentors see only the students
+    and tests of their own cohorts. Students join with the cohort's code;
+    mentors join with the separate mentor_code, which only its mentors see.
+    The is_default cohort takes in students who register without a code.
+    """
+    name = models.CharField(max_length=100)
+    code = models.CharField(max_length=50, unique=True)
+    mentor_code = models.CharField(max_length=50, unique=True, default=generate_mentor_code)
+    mentors = models.ManyToManyField(MentorProfile, related_name='cohorts', blank=True)
+    students = models.ManyToManyField(StudentProfile, related_name='cohorts', blank=True)
+    tests = models.ManyToManyField(Test, related_name='cohorts', blank=True)
+    is_default = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Cohort'
+        verbose_name_plural = 'Cohorts'
+        constraints = [
+            models.UniqueConstraint(fields=['is_default'], condition=models.Q(is_default=True),
+                                    name='portal_cohort_single_default'),
+        ]
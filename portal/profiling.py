@@ -0,0 +1,188 @@
+"""
+On-demand and sampled request profiling.
+
+A staff user can profile a single request by adding ?profile=1 (or the
+X-Profile: 1 header): the response is replaced by a JSON report of the
+hottest functions and SQL time. ?profile=store keeps the normal response and
+writes a .prof file (readable by pstats, snakeviz or flameprof for flame
+graphs) to PROFILE_DIR, named in the X-Profile-Report header.
+
+With PROFILE_SAMPLE_EVERY = N, one in N requests is profiled silently and
+folded into a per-process aggregate, served at /portal/profiling/ and dumped
+to PROFILE_DIR periodically. Requests that are neither sampled nor flagged
+only pay for a counter increment and a dict lookup, and under ASGI stay
+async; only profiled requests drop to a thread, since cProfile sees just the
+thread it runs in.
+"""
+import cProfile
+import itertools
+import os
+import pstats
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from rest_framework.authtoken.models import Token
+
+_aggregate = None
+_aggregate_samples = 0
+_aggregate_sql = {'queries': 0, 'seconds': 0.0}
+_aggregate_lock = threading.Lock()
+
+
+class SQLTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+def top_functions(stats, limit=40, sort='cumulative'):
+    key = {'cumulative': 3, 'tottime': 2, 'calls': 1}[sort]
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)[:limit]
+    return [
+        {
+            'function': pstats.func_std_string(func),
+            'ncalls': nc,
+            'primitive_calls': cc,
+            'tottime_ms': round(tt * 1000, 3),
+            'cumtime_ms': round(ct * 1000, 3),
+        }
+        for func, (cc, nc, tt, ct, _) in rows
+    ]
+
+
+def aggregate_report(limit=40, sort='tottime'):
+    with _aggregate_lock:
+        if _aggregate is None:
+            return {'samples': 0, 'sql': {'queries': 0, 'time_ms': 0.0}, 'functions': []}
+        return {
+            'samples': _aggregate_samples,
+            'sql': {'queries': _aggregate_sql['queries'], 'time_ms': round(_aggregate_sql['seconds'] * 1000, 3)},
+            'functions': top_functions(_aggregate, limit, sort),
+        }
+
+
+def _add_to_aggregate(profiler, sql):
+    global _aggregate, _aggregate_samples
+    with _aggregate_lock:
+        _aggregate_sql['queries'] += sql.count
+        _aggregate_sql['seconds'] += sql.seconds
+        if _aggregate is None:
+            _aggregate = pstats.Stats(profiler)
+        else:
+            _aggregate.add(profiler)
+        _aggregate_samples += 1
+        if _aggregate_samples % settings.PROFILE_AGGREGATE_DUMP_EVERY == 0:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            _aggregate.dump_stats(os.path.join(settings.PROFILE_DIR, f'aggregate-{os.getpid()}.prof'))
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return False
+    return Token.objects.filter(key=auth[1], user__is_staff=True, user__is_active=True).exists()
+
+
+def _requested_mode(request):
+    mode = request.GET.get('profile') or request.headers.get('X-Profile')
+    return mode if mode in ('1', 'true', 'store') else None
+
+
+class RequestProfilerMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_every = settings.PROFILE_SAMPLE_EVERY
+        self.counter = itertools.count(1)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not request.path.startswith('/portal/'):
+            return self.get_response(request)
+        mode = _requested_mode(request)
+        if mode and _is_staff(request):
+            return self.profile(request, mode, self.get_response)
+        if self.sampled():
+            return self.profile(request, None, self.get_response)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not request.path.startswith('/portal/'):
+            return await self.get_response(request)
+        mode = _requested_mode(request)
+        if mode and await sync_to_async(_is_staff)(request):
+            return await self.profile_in_thread(request, mode)
+        if self.sampled():
+            return await self.profile_in_thread(request, None)
+        return await self.get_response(request)
+
+    def sampled(self):
+        return self.sample_every and next(self.counter) % self.sample_every == 0
+
+    async def profile_in_thread(self, request, mode):
+        # Sync views run in the request's thread-sensitive thread; profiling
+        # from there makes the rest of the chain come back to it
+        return await sync_to_async(self.profile)(request, mode, async_to_sync(self.get_response))
+
+    def profile(self, request, mode, get_response):
+        profiler = cProfile.Profile()
+        sql = SQLTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql))
+            start = time.perf_counter()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this thread
+                return get_response(request)
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+
+        if mode is None:
+            _add_to_aggregate(profiler, sql)
+            return response
+
+        if mode == 'store':
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{request.path.strip("/").replace("/", "_")}.prof'
+            profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+            response['X-Profile-Report'] = name
+            return response
+
+        sort = request.GET.get('profile_sort')
+        if sort not in ('cumulative', 'tottime', 'calls'):
+            sort = 'cumulative'
+        return JsonResponse({
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(elapsed * 1000, 3),
+            'sql': {'queries': sql.count, 'time_ms': round(sql.seconds * 1000, 3)},
+            'functions': top_functions(pstats.Stats(profiler), sort=sort),
+        })
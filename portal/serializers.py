@@ -1,8 +1,12 @@
 # serializers.py
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from .models import StudentProfile, MentorProfile, Test, TestScore
+from django.db import models
+from .models import StudentProfile, MentorProfile, Test, TestScore, Job, TestScoreHistory, Cohort
+from .cache import test_cache
+from .cohorts import cohort_student_ids, cohort_test_ids, default_cohort, generate_code, test_in_cohorts
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,13 +19,22 @@ class StudentRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
     first_name = serializers.CharField(write_only=True, required=False)
     last_name = serializers.CharField(write_only=True, required=False)
+    cohort_code = serializers.CharField(write_only=True, required=False)
     
     class Meta:
         model = StudentProfile
         fields = ['username', 'email', 'password', 'first_name', 'last_name', 
-                 'leetcode', 'github', 'photo', 'bio']
+                 'leetcode', 'github', 'photo', 'bio', 'cohort_code']
+
+    def validate_cohort_code(self, value):
+        if not Cohort.objects.filter(code=value).exists():
+            raise serializers.ValidationError("No cohort with this code")
+        return value
     
     def create(self, validated_data):
+        code = validated_data.pop('cohort_code', None)
+        cohort = Cohort.objects.get(code=code) if code else default_cohort()
+
         # Extract user data
         user_data = {
             'username': validated_data.pop('username'),
@@ -36,6 +49,8 @@ class StudentRegistrationSerializer(serializers.ModelSerializer):
         
         # Create student profile
         student_profile = StudentProfile.objects.create(user=user, **validated_data)
+        if cohort is not None:
+            cohort.students.add(student_profile)
         return student_profile
 class StudentProfileUpdateSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(required=False)
@@ -74,13 +89,23 @@ class MentorRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
     first_name = serializers.CharField(write_only=True, required=False)
     last_name = serializers.CharField(write_only=True, required=False)
+    cohort_code = serializers.CharField(write_only=True, required=False)
     
     class Meta:
         model = MentorProfile
         fields = ['username', 'email', 'password', 'first_name', 'last_name', 
-                 'expertise', 'github', 'photo', 'bio']
+                 'expertise', 'github', 'photo', 'bio', 'cohort_code']
+
+    def validate_cohort_code(self, value):
+        # Mentors join with the mentor code, never with the code given to students
+        if not Cohort.objects.filter(mentor_code=value).exists():
+            raise serializers.ValidationError("No cohort with this mentor code")
+        return value
     
     def create(self, validated_data):
+        code = validated_data.pop('cohort_code', None)
+        cohort = Cohort.objects.get(mentor_code=code) if code else None
+
         # Extract user data
         user_data = {
             'username': validated_data.pop('username'),
@@ -95,6 +120,8 @@ class MentorRegistrationSerializer(serializers.ModelSerializer):
         
         # Create mentor profile
         mentor_profile = MentorProfile.objects.create(user=user, **validated_data)
+        if cohort is not None:
+            cohort.mentors.add(mentor_profile)
         return mentor_profile
 class MentorProfileUpdateSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(required=False)
@@ -147,17 +174,6 @@ class LoginSerializer(serializers.Serializer):
         
         return data
 
-class TestSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Test
-        fields = ['id', 'name', 'description', 'created_at', 'updated_at']
-
-class TestScoreSerializer(serializers.ModelSerializer):
-    test = TestSerializer(read_only=True)
-    
-    class Meta:
-        model = TestScore
-        fields = ['id', 'test', 'score', 'date_taken']
 
 
 class MentorProfileSerializer(serializers.ModelSerializer):
@@ -176,17 +192,14 @@ class TestScoreCreateSerializer(serializers.ModelSerializer):
         fields = ['student_id', 'test_id', 'score']
     
     def validate_student_id(self, value):
-        try:
-            StudentProfile.objects.get(id=value)
-        except StudentProfile.DoesNotExist:
-            raise serializers.ValidationError("Student does not exist")
+        # context['cohort_ids']: the requesting mentor's cohorts
+        if not StudentProfile.objects.filter(id=value, id__in=cohort_student_ids(self.context['cohort_ids'])).exists():
+            raise serializers.ValidationError("Student does not exist in your cohorts")
         return value
     
     def validate_test_id(self, value):
-        try:
-            Test.objects.get(id=value)
-        except Test.DoesNotExist:
-            raise serializers.ValidationError("Test does not exist")
+        if test_cache.get(value) is None or not test_in_cohorts(value, self.context['cohort_ids']):
+            raise serializers.ValidationError("Test does not exist in your cohorts")
         return value
     
     def validate_score(self, value):
@@ -199,7 +212,7 @@ class TestScoreCreateSerializer(serializers.ModelSerializer):
         test_id = validated_data.pop('test_id')
         
         student = StudentProfile.objects.get(id=student_id)
-        test = Test.objects.get(id=test_id)
+        test = test_cache.get(test_id)
         
         # Check if score already exists for this student and test
         existing_score = TestScore.objects.filter(student=student, test=test).first()
@@ -227,7 +240,8 @@ class TestCreateSerializer(serializers.ModelSerializer):
         fields = ['name', 'description']
     
     def validate_name(self, value):
-        if Test.objects.filter(name__iexact=value).exists():
+        # Names are unique within the cohorts the test is created in (context['cohort_ids'])
+        if Test.objects.filter(name__iexact=value, id__in=cohort_test_ids(self.context['cohort_ids'])).exists():
             raise serializers.ValidationError("A test with this name already exists")
         return value
 class TestSerializer(serializers.ModelSerializer):
@@ -235,22 +249,33 @@ class TestSerializer(serializers.ModelSerializer):
         model = Test
         fields = ['id', 'name', 'description', 'created_at', 'updated_at']
 
+class TestScoreListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, models.manager.BaseManager) else data
+        # Warm the Test cache for the whole list with at most one query
+        test_cache.get_many({item.test_id for item in items})
+        return super().to_representation(items)
+
 class TestScoreSerializer(serializers.ModelSerializer):
-    test = TestSerializer(read_only=True)
+    # Resolved through the per-process Test cache rather than a query per score
+    test = serializers.SerializerMethodField()
     
     class Meta:
         model = TestScore
         fields = ['id', 'test', 'score', 'date_taken']
+        list_serializer_class = TestScoreListSerializer
+
+    def get_test(self, obj):
+        return test_cache.get_data(obj.test_id)
 class TestUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Test
         fields = ['name', 'description']
     
     def validate_name(self, value):
-        # Check for duplicate name excluding current instance
-        if self.instance and Test.objects.filter(name__iexact=value).exclude(id=self.instance.id).exists():
-            raise serializers.ValidationError("A test with this name already exists")
-        elif not self.instance and Test.objects.filter(name__iexact=value).exists():
+        # Check for duplicate name in the test's cohorts, excluding current instance
+        cohort_ids = Cohort.objects.filter(tests=self.instance).values('id')
+        if Test.objects.filter(name__iexact=value, id__in=cohort_test_ids(cohort_ids)).exclude(id=self.instance.id).exists():
             raise serializers.ValidationError("A test with this name already exists")
         return value
 
@@ -261,4 +286,122 @@ class StudentProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = StudentProfile
         fields = ['id', 'user', 'leetcode', 'github', 'dateJoined', 
-                 'photo', 'bio', 'test_scores']
\ No newline at end of file
+                 'photo', 'bio', 'test_scores']
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'payload', 'status', 'attempts', 'max_attempts', 'progress',
+                  'progress_message', 'result', 'error', 'created_at', 'updated_at']
+
+class ExportScoresPayloadSerializer(serializers.Serializer):
+    test_id = serializers.IntegerField(required=False)
+    cohort_id = serializers.IntegerField(required=False)
+
+class ScoreSnapshotPayloadSerializer(serializers.Serializer):
+    cohort_id = serializers.IntegerField(required=False)
+
+# Job kinds users may submit, with the serializer for each kind's payload.
+# delete_test is only queued by deleting a test.
+SUBMITTABLE_JOBS = {
+    'export_scores': ExportScoresPayloadSerializer,
+    'score_snapshot': ScoreSnapshotPayloadSerializer,
+}
+
+class JobCreateSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    payload = serializers.JSONField(required=False, default=dict)
+
+    def validate_kind(self, value):
+        if value not in SUBMITTABLE_JOBS:
+            raise serializers.ValidationError(f'Unknown job kind. Choose one of: {", ".join(sorted(SUBMITTABLE_JOBS))}')
+        return value
+
+    def validate_payload(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Payload must be an object")
+        return value
+
+    def validate(self, data):
+        payload = SUBMITTABLE_JOBS[data['kind']](data=data['payload'])
+        if not payload.is_valid():
+            raise serializers.ValidationError({'payload': payload.errors})
+        data['payload'] = dict(payload.validated_data)
+        return data
+
+class TestScoreHistorySerializer(serializers.ModelSerializer):
+    action = serializers.CharField(source='get_action_display')
+
+    class Meta:
+        model = TestScoreHistory
+        fields = ['id', 'timestamp', 'action', 'score_id', 'student_id', 'test_id', 'score']
+
+class CohortSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cohort
+        fields = ['id', 'name', 'created_at']
+
+class MentorCohortSerializer(serializers.ModelSerializer):
+    # Join codes are only shown to the cohort's mentors
+    class Meta:
+        model = Cohort
+        fields = ['id', 'name', 'code', 'mentor_code', 'created_at']
+
+class CohortCreateSerializer(serializers.ModelSerializer):
+    code = serializers.CharField(max_length=50, required=False)
+
+    class Meta:
+        model = Cohort
+        fields = ['name', 'code']
+
+    def validate_code(self, value):
+        if value == settings.DEFAULT_COHORT_CODE:
+            # Reserved, so students registering without a code never join a mentor's own cohort
+            raise serializers.ValidationError("This code is reserved")
+        if Cohort.objects.filter(code=value).exists():
+            raise serializers.ValidationError("A cohort with this code already exists")
+        return value
+
+    def create(self, validated_data):
+        validated_data.setdefault('code', generate_code())
+        return super().create(validated_data)
+
+class DashboardStudentSerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+    score_count = serializers.IntegerField(read_only=True)
+    average_score = serializers.FloatField(read_only=True)
+    best_score = serializers.IntegerField(read_only=True)
+    last_score_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = StudentProfile
+        fields = ['id', 'user', 'leetcode', 'github', 'photo',
+                  'score_count', 'average_score', 'best_score', 'last_score_at']
+
+class DashboardTestSerializer(serializers.ModelSerializer):
+    completion_count = serializers.IntegerField(read_only=True)
+    average_score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Test
+        fields = ['id', 'name', 'description', 'created_at', 'updated_at',
+                  'completion_count', 'average_score']
+
+class StudentProfileChangeSerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = StudentProfile
+        fields = ['id', 'user', 'leetcode', 'github', 'dateJoined', 'photo', 'bio', 'updated_at']
+
+class MentorProfileChangeSerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = MentorProfile
+        fields = ['id', 'user', 'expertise', 'github', 'dateJoined', 'photo', 'bio', 'updated_at']
+
+class TestScoreChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TestScore
+        fields = ['id', 'student_id', 'test_id', 'score', 'date_taken', 'updated_at']
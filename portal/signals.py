@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_tests
+from .events import notify_score_changed
+from .models import StudentProfile, MentorProfile, Test, TestScore, TestScoreHistory, ChangeLogEntry
+
+# Synced model -> name used in ChangeLogEntry.model and the /changes/ feed
+CHANGE_TRACKED_MODELS = {
+    StudentProfile: 'student',
+    MentorProfile: 'mentor',
+    Test: 'test',
+    TestScore: 'test_score',
+}
+
+
+def _record(instance, action):
+    TestScoreHistory.objects.create(
+        action=action,
+        score_id=instance.id,
+        student_id=instance.student_id,
+        test_id=instance.test_id,
+        score=instance.score,
+    )
+    # Push to score event streams in this process without waiting for their next poll
+    transaction.on_commit(notify_score_changed)
+
+
+@receiver(post_save, sender=TestScore)
+def record_score_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    _record(instance, TestScoreHistory.ACTION_CREATED if created else TestScoreHistory.ACTION_UPDATED)
+
+
+@receiver(post_delete, sender=TestScore)
+def record_score_deleted(sender, instance, **kwargs):
+    _record(instance, TestScoreHistory.ACTION_DELETED)
+
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def test_changed(sender, instance, raw=False, **kwargs):
+    invalidate_tests()
+
+
+def record_change(instance, action):
+    """
+    Append a change log entry for an instance of a change-tracked model
+    """
+    if isinstance(instance, StudentProfile):
+        student_id = instance.id
+    else:
+        student_id = getattr(instance, 'student_id', None)
+    ChangeLogEntry.objects.create(
+        model=CHANGE_TRACKED_MODELS[type(instance)],
+        object_id=instance.id,
+        action=action,
+        student_id=student_id,
+    )
+
+
+def change_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    record_change(instance, ChangeLogEntry.ACTION_CREATED if created else ChangeLogEntry.ACTION_UPDATED)
+
+
+def change_deleted(sender, instance, **kwargs):
+    record_change(instance, ChangeLogEntry.ACTION_DELETED)
+
+
+for tracked_model in CHANGE_TRACKED_MODELS:
+    post_save.connect(change_saved, sender=tracked_model, dispatch_uid=f'change_saved_{tracked_model.__name__}')
+    post_delete.connect(change_deleted, sender=tracked_model, dispatch_uid=f'change_deleted_{tracked_model.__name__}')
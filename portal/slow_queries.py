@@ -0,0 +1,198 @@
+"""
+Opt-in slow query log.
+
+When SLOW_QUERY_LOG_ENABLED is set, SlowQueryLogMiddleware wraps every
+request's database access with an execute wrapper that times each query.
+Queries slower than SLOW_QUERY_THRESHOLD_MS are recorded with their
+normalized SQL, parameter shape, duration, originating view and call site,
+and the database's query plan. Entries go to an in-process ring buffer
+(served at /portal/slow-queries/) and to the 'portal.slow_queries' logger,
+which settings route to a rotating file. When disabled the middleware
+removes itself at startup and costs nothing, so under ASGI requests only
+drop to a thread for it while the log is on.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger('portal.slow_queries')
+
+_buffer = deque(maxlen=settings.SLOW_QUERY_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Collapse literals and IN lists so the same query shape groups together
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def params_shape(params, many):
+    if params is None:
+        return None
+    if many:
+        params = list(params)
+        first = params[0] if params else ()
+        return {'rows': len(params), 'types': [type(p).__name__ for p in first]}
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(p).__name__ for p in params]
+
+
+def call_site():
+    """
+    Innermost stack frame in project code, outside this module
+    """
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if (frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+                and not frame.filename.endswith(('slow_queries.py', 'manage.py'))):
+            return f'{frame.filename[len(base_dir) + 1:]}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def record(entry):
+    with _buffer_lock:
+        _buffer.append(entry)
+    logger.warning(json.dumps(entry, default=str))
+
+
+def recent_entries():
+    with _buffer_lock:
+        return list(_buffer)
+
+
+def top_offenders(order_by='total_ms', limit=20):
+    """
+    Ring buffer entries grouped by normalized SQL, worst first
+    """
+    groups = {}
+    for entry in recent_entries():
+        group = groups.setdefault(entry['sql'], {
+            'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'views': set(), 'call_sites': set(), 'plan': None, 'last_seen': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        if entry['duration_ms'] >= group['max_ms']:
+            group['max_ms'] = entry['duration_ms']
+            group['plan'] = entry['plan']
+            group['params_shape'] = entry['params_shape']
+        group['views'].add(entry['view'])
+        group['call_sites'].add(entry['call_site'])
+        group['last_seen'] = entry['timestamp']
+    ranked = sorted(groups.values(), key=lambda g: g[order_by], reverse=True)[:limit]
+    for group in ranked:
+        group['total_ms'] = round(group['total_ms'], 2)
+        group['views'] = sorted(v for v in group['views'] if v)
+        group['call_sites'] = sorted(c for c in group['call_sites'] if c)
+    return ranked
+
+
+class QueryRecorder:
+    """
+    Execute wrapper timing queries on one connection for one request
+    """
+
+    def __init__(self, connection, request, threshold_ms):
+        self.connection = connection
+        self.request = request
+        self.threshold_ms = threshold_ms
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= self.threshold_ms:
+            record({
+                'timestamp': timezone.now().isoformat(),
+                'duration_ms': round(duration_ms, 2),
+                'database': self.connection.alias,
+                'sql': normalize_sql(sql),
+                'params_shape': params_shape(params, many),
+                'view': self.view_name(),
+                'path': self.request.path,
+                'call_site': call_site(),
+                'plan': None if many else self.explain(sql, params),
+            })
+        return result
+
+    def view_name(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else None
+
+    def explain(self, sql, params):
+        prefix = EXPLAIN_PREFIXES.get(self.connection.vendor)
+        if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+            return None
+        self.explaining = True
+        try:
+            # Savepoint so a failed EXPLAIN cannot poison the caller's transaction
+            with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                return [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+        except Exception as exc:
+            return [f'EXPLAIN failed: {exc}']
+        finally:
+            self.explaining = False
+
+
+class SlowQueryLogMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold_ms = settings.SLOW_QUERY_THRESHOLD_MS
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.record_queries(request, self.get_response)
+
+    async def __acall__(self, request):
+        # Execute wrappers belong to the connections of one thread: install
+        # them in the request's thread-sensitive thread, where sync views run
+        return await sync_to_async(self.record_queries)(request, async_to_sync(self.get_response))
+
+    def record_queries(self, request, get_response):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(
+                    QueryRecorder(connection, request, self.threshold_ms)
+                ))
+            return get_response(request)
@@ -0,0 +1,168 @@
+"""
+Columnar snapshots of TestScore for offline analytics.
+
+A snapshot is a directory of plain .npy arrays, one per column, plus .npz
+lookup tables for students and tests:
+
+    scores_id.npy          int64
+    scores_student_id.npy  int64
+    scores_test_id.npy     int64
+    scores_score.npy       int16
+    scores_date_taken.npy  datetime64[us] (UTC)
+    students.npz           id, user_id, username
+    tests.npz              id, name
+
+Column files are uncompressed so load_snapshot() can memory-map them: opening
+a snapshot reads only the headers, and processes analysing the same files
+share the page cache instead of each holding a private copy.
+"""
+import os
+from datetime import timezone as dt_timezone
+
+import numpy as np
+
+SCORE_COLUMNS = {
+    'id': np.int64,
+    'student_id': np.int64,
+    'test_id': np.int64,
+    'score': np.int16,
+    'date_taken': 'datetime64[us]',
+}
+
+
+def _column_path(directory, column):
+    return os.path.join(directory, f'scores_{column}.npy')
+
+
+def write_snapshot(directory, chunk_size=50000, report_progress=None, cohort_ids=None):
+    """
+    Stream TestScore rows from the database into column arrays in `directory`,
+    limited to the students and tests of `cohort_ids` when given.
+
+    Rows are read in keyset-paginated chunks of `chunk_size` and written
+    straight into pre-sized memory-mapped files, so memory use is bounded by
+    the chunk size rather than the table size. Files are written under a
+    .tmp name and renamed into place at the end so readers never observe a
+    partial snapshot. Returns the number of score rows written.
+    """
+    # Imported here so load_snapshot() works without a configured Django project
+    from django.db.models import Q
+
+    from .cohorts import cohort_student_ids, cohort_test_ids
+    from .models import StudentProfile, Test, TestScore
+
+    os.makedirs(directory, exist_ok=True)
+    scores = TestScore.objects.order_by('id')
+    students = StudentProfile.objects.order_by('id')
+    tests = Test.objects.order_by('id')
+    if cohort_ids is not None:
+        scores = scores.filter(student_id__in=cohort_student_ids(cohort_ids))
+        students = students.filter(id__in=cohort_student_ids(cohort_ids))
+        # Also any test a cohort student was scored on, so test_names() never misses
+        tests = tests.filter(Q(id__in=cohort_test_ids(cohort_ids)) | Q(id__in=scores.values('test_id')))
+    max_id = scores.values_list('id', flat=True).last()
+    if max_id is not None:
+        scores = scores.filter(id__lte=max_id)
+    total = scores.count()
+
+    tmp_paths = {column: _column_path(directory, column) + '.tmp' for column in SCORE_COLUMNS}
+    arrays = {
+        column: np.lib.format.open_memmap(tmp_paths[column], mode='w+', dtype=dtype, shape=(total,))
+        for column, dtype in SCORE_COLUMNS.items()
+    }
+
+    written = 0
+    last_id = 0
+    while written < total:
+        rows = list(
+            scores.filter(id__gt=last_id)
+            .values_list('id', 'student_id', 'test_id', 'score', 'date_taken')[:min(chunk_size, total - written)]
+        )
+        if not rows:
+            break
+        end = written + len(rows)
+        ids, student_ids, test_ids, values, dates = zip(*rows)
+        arrays['id'][written:end] = ids
+        arrays['student_id'][written:end] = student_ids
+        arrays['test_id'][written:end] = test_ids
+        arrays['score'][written:end] = values
+        arrays['date_taken'][written:end] = [
+            d.astimezone(dt_timezone.utc).replace(tzinfo=None) for d in dates
+        ]
+        written = end
+        last_id = ids[-1]
+        if report_progress is not None:
+            report_progress(written * 100 // total, f'{written}/{total} scores written')
+
+    for column, array in arrays.items():
+        if written < total:
+            # Rows disappeared while streaming (e.g. a test was deleted); trim the file
+            np.save(tmp_paths[column] + '.npy', array[:written])
+            os.replace(tmp_paths[column] + '.npy', tmp_paths[column])
+        else:
+            array.flush()
+    arrays.clear()
+
+    student_rows = list(zip(*students.values_list('id', 'user_id', 'user__username'))) or [(), (), ()]
+    _save_lookup(directory, 'students', id=np.array(student_rows[0], dtype=np.int64),
+                 user_id=np.array(student_rows[1], dtype=np.int64),
+                 username=np.array(student_rows[2], dtype=str))
+
+    test_rows = list(zip(*tests.values_list('id', 'name'))) or [(), ()]
+    _save_lookup(directory, 'tests', id=np.array(test_rows[0], dtype=np.int64),
+                 name=np.array(test_rows[1], dtype=str))
+
+    for column in SCORE_COLUMNS:
+        os.replace(tmp_paths[column], _column_path(directory, column))
+    return written
+
+
+def _save_lookup(directory, table, **arrays):
+    path = os.path.join(directory, f'{table}.npz')
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+
+
+class Snapshot:
+    """
+    A loaded snapshot. `scores` maps column name to a read-only memory-mapped
+    array; `students` and `tests` are small in-memory lookup tables.
+    """
+
+    def __init__(self, scores, students, tests):
+        self.scores = scores
+        self.students = students
+        self.tests = tests
+
+    def __len__(self):
+        return len(self.scores['id'])
+
+    def usernames(self, student_ids):
+        """
+        Map an array of student ids to usernames via the lookup table
+        """
+        index = np.searchsorted(self.students['id'], student_ids)
+        return self.students['username'][index]
+
+    def test_names(self, test_ids):
+        """
+        Map an array of test ids to test names via the lookup table
+        """
+        index = np.searchsorted(self.tests['id'], test_ids)
+        return self.tests['name'][index]
+
+
+def load_snapshot(directory):
+    """
+    Open a snapshot written by write_snapshot() without reading the column data
+    """
+    scores = {
+        column: np.load(_column_path(directory, column), mmap_mode='r')
+        for column in SCORE_COLUMNS
+    }
+    with np.load(os.path.join(directory, 'students.npz')) as students:
+        students = dict(students)
+    with np.load(os.path.join(directory, 'tests.npz')) as tests:
+        tests = dict(tests)
+    return Snapshot(scores, students, tests)
@@ -1,3 +1,1090 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import importlib
+import os
+import pstats
+import signal
+import tempfile
+import threading
+import unittest
+from collections import deque
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.apps import apps
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import events, jobs, profiling, slow_queries
+from .cache import VERSION_KEY, test_cache
+from .events import Subscription, get_broker, stream_score_events
+from .management.commands import run_workers
+from .management.commands.serve import get_application, warm_asgi_request, warm_request, warm_serializers
+from .models import StudentProfile, MentorProfile, Test, TestScore, Cohort, Job, TestScoreHistory, ChangeLogEntry
+from .snapshot import load_snapshot, write_snapshot
+from .serializers import MentorRegistrationSerializer, StudentRegistrationSerializer, TestScoreSerializer
+from .throttling import BucketStore
+
+
+@contextmanager
+def private_shared_cache():
+    """
+    Point the host-wide 'shared' cache at a throwaway directory, so tests
+    never bump the test cache version of a server running on this host
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        shared = {**settings.CACHES['shared'], 'LOCATION': directory}
+        with override_settings(CACHES={**settings.CACHES, 'shared': shared}):
+            yield
+
+
+def setUpModule():
+    # Any Test write invalidates through the shared cache
+    unittest.enterModuleContext(private_shared_cache())
+
+
+class JobQueueTests(TestCase):
+    def failing_handler(self, job, report_progress):
+        raise RuntimeError('boom')
+
+    def test_claim_next_hands_each_job_to_one_worker(self):
+        first = jobs.submit('export_scores')
+        second = jobs.submit('export_scores')
+        later = jobs.submit('export_scores')
+        Job.objects.filter(id=later.id).update(run_after=timezone.now() + timedelta(hours=1))
+
+        claimed = jobs.claim_next('worker-a')
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), (Job.STATUS_RUNNING, 'worker-a', 1))
+        self.assertEqual(jobs.claim_next('worker-b').id, second.id)
+        self.assertIsNone(jobs.claim_next('worker-c'))
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'flaky': self.failing_handler}):
+            job = jobs.submit('flaky', max_attempts=2)
+            jobs.run_job(jobs.claim_next('worker'))
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.STATUS_PENDING)
+            self.assertIn('RuntimeError: boom', job.error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=1))
+            self.assertIsNone(jobs.claim_next('worker'))
+
+            Job.objects.filter(id=job.id).update(run_after=timezone.now())
+            jobs.run_job(jobs.claim_next('worker'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 2))
+
+    def test_worker_that_lost_its_claim_cannot_clobber_the_job(self):
+        def requeued_midway(job, report_progress):
+            # The job looks stale, is requeued and claimed by another worker
+            Job.objects.filter(id=job.id).update(status=Job.STATUS_PENDING, locked_by='', locked_at=None)
+            self.assertEqual(jobs.claim_next('worker-b').id, job.id)
+            if job.payload.get('heartbeat'):
+                report_progress(50, 'still going')
+            return {'done': True}
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'slow': requeued_midway}):
+            for payload in ({}, {'heartbeat': True}):
+                job = jobs.submit('slow', payload)
+                with self.assertLogs('portal.jobs', 'WARNING'):
+                    jobs.run_job(jobs.claim_next('worker-a'))
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.locked_by, job.progress, job.result),
+                                 (Job.STATUS_RUNNING, 'worker-b', 0, None))
+
+    def test_worker_backs_off_after_database_errors(self):
+        claim_results = [OperationalError('database is locked'), OperationalError('database is locked'), None]
+        with mock.patch.object(jobs, 'claim_next', side_effect=claim_results) as claim_next, \
+                mock.patch.object(jobs.time, 'sleep') as sleep, self.assertLogs('portal.jobs', 'ERROR'):
+            jobs.work('worker', poll_interval=1, burst=True)
+        self.assertEqual(claim_next.call_count, 3)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [2, 4])
+
+    def test_run_workers_replaces_dead_workers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+
+        def crash_once(worker_id, poll_interval, burst, stop_event):
+            open(os.path.join(directory.name, worker_id), 'w').close()
+            try:
+                os.close(os.open(os.path.join(directory.name, 'crashed'), os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                return
+            os._exit(3)
+
+        stderr = StringIO()
+        with mock.patch.object(run_workers, 'work', crash_once), mock.patch.object(run_workers, 'MIN_WORKER_UPTIME', 0):
+            call_command('run_workers', processes=2, burst=True, stdout=StringIO(), stderr=stderr)
+        self.assertIn('exited with code 3, restarting', stderr.getvalue())
+        self.assertEqual(len(os.listdir(directory.name)), 4)  # three workers and the crash marker
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        stale = timezone.now() - timedelta(hours=1)
+        retry = Job.objects.create(kind='export_scores', status=Job.STATUS_RUNNING, attempts=1, locked_at=stale)
+        spent = Job.objects.create(kind='export_scores', status=Job.STATUS_RUNNING, attempts=3, locked_at=stale)
+        alive = Job.objects.create(kind='export_scores', status=Job.STATUS_RUNNING, attempts=1,
+                                   locked_at=timezone.now())
+
+        self.assertEqual(jobs.requeue_stale_jobs(), (1, 1))
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[retry.id], Job.STATUS_PENDING)
+        self.assertEqual(statuses[spent.id], Job.STATUS_FAILED)
+        self.assertEqual(statuses[alive.id], Job.STATUS_RUNNING)
+
+    def test_submit_validates_kind_and_payload(self):
+        user = User.objects.create_user(username='mentor')
+        MentorProfile.objects.create(user=user, expertise='Python', github='mentor')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+        self.assertEqual(client.post('/portal/jobs/', {'kind': 'delete_test', 'payload': {'test_id': 1}},
+                                     format='json').status_code, 400)
+        self.assertEqual(client.post('/portal/jobs/', {'kind': 'export_scores', 'payload': {'test_id': 'x'}},
+                                     format='json').status_code, 400)
+        response = client.post('/portal/jobs/', {'kind': 'export_scores', 'payload': {'test_id': 1, 'other': 1}},
+                               format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['data']['payload'], {'test_id': 1})
+
+
+class TestDeletionTests(TestCase):
+    def setUp(self):
+        mentor_user = User.objects.create_user(username='mentor')
+        cohort = Cohort.objects.create(name='Cohort', code='cohort')
+        cohort.mentors.add(MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=mentor_user).key)
+        self.test = Test.objects.create(name='Midterm', description='')
+        cohort.tests.add(self.test)
+        for i in range(5):
+            student = StudentProfile.objects.create(user=User.objects.create_user(username=f'student{i}'))
+            cohort.students.add(student)
+            TestScore.objects.create(student=student, test=self.test, score=50 + i)
+
+    def test_delete_hides_test_and_queues_purge(self):
+        response = self.client.delete(f'/portal/tests/{self.test.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Test.all_objects.get(id=self.test.id).is_hidden)
+        self.assertFalse(Test.objects.filter(id=self.test.id).exists())
+        self.assertFalse(TestScore.objects.filter(test_id=self.test.id).exists())
+        self.assertEqual(TestScore.all_objects.filter(test_id=self.test.id).count(), 5)
+        self.assertEqual(self.client.get(f'/portal/tests/{self.test.id}/').status_code, 404)
+        self.assertEqual(Job.objects.get(id=response.data['job_id']).payload, {'test_id': self.test.id})
+
+    def test_purge_deletes_scores_in_batches(self):
+        Test.all_objects.filter(id=self.test.id).update(is_hidden=True)
+        progress = []
+        deleted = jobs.purge_test(self.test.id, batch_size=2,
+                                  report_progress=lambda percent, message: progress.append(message))
+        self.assertEqual(deleted, 5)
+        self.assertEqual(progress, ['2/5 scores deleted', '4/5 scores deleted', '5/5 scores deleted'])
+        self.assertFalse(Test.all_objects.filter(id=self.test.id).exists())
+        self.assertFalse(TestScore.all_objects.exists())
+
+
+class ScoreHistoryTests(TestCase):
+    def setUp(self):
+        mentor_user = User.objects.create_user(username='mentor')
+        cohort = Cohort.objects.create(name='Cohort', code='cohort')
+        cohort.mentors.add(MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=mentor_user).key)
+        self.test = Test.objects.create(name='Midterm', description='')
+        cohort.tests.add(self.test)
+        self.student = StudentProfile.objects.create(user=User.objects.create_user(username='student'))
+        cohort.students.add(self.student)
+
+    def test_keyset_pages_cover_history_once_in_order(self):
+        score = TestScore.objects.create(student=self.student, test=self.test, score=50)
+        for value in range(51, 56):
+            score.score = value
+            score.save()
+        # Equal timestamps must be ordered and paged by id
+        TestScoreHistory.objects.filter(id__in=TestScoreHistory.objects.order_by('id').values('id')[:3]).update(
+            timestamp=timezone.now() - timedelta(minutes=1),
+        )
+        expected = list(TestScoreHistory.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+
+        seen, cursor = [], None
+        while True:
+            url = '/portal/test-scores/history/?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [entry['id'] for entry in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get('/portal/test-scores/history/?cursor=bogus').status_code, 400)
+
+    def test_score_and_its_log_entries_commit_together(self):
+        with mock.patch.object(ChangeLogEntry.objects, 'create', side_effect=RuntimeError('log unavailable')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/portal/test-scores/', {'student_id': self.student.id, 'test_id': self.test.id,
+                                                          'score': 70}, format='json')
+        self.assertFalse(TestScore.objects.exists())
+        self.assertFalse(TestScoreHistory.objects.exists())
+
+    def test_compaction_archives_old_entries(self):
+        score = TestScore.objects.create(student=self.student, test=self.test, score=50)
+        score.score = 60
+        score.save()
+        old = TestScoreHistory.objects.get(action=TestScoreHistory.ACTION_CREATED)
+        TestScoreHistory.objects.filter(id=old.id).update(timestamp=timezone.now() - timedelta(days=400))
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command('compact_score_history', older_than_days=365, archive_dir=archive_dir,
+                         batch_size=1, stdout=StringIO())
+            call_command('compact_score_history', older_than_days=365, archive_dir=archive_dir, stdout=StringIO())
+            [name] = os.listdir(archive_dir)
+            with gzip.open(os.path.join(archive_dir, name), 'rt', newline='') as f:
+                rows = list(csv.reader(f))
+
+        self.assertEqual(rows[0][0], 'id')
+        self.assertEqual([row[0] for row in rows[1:]], [str(old.id)])
+        self.assertEqual(list(TestScoreHistory.objects.values_list('score', flat=True)), [60])
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        cohort = Cohort.objects.create(name='Cohort', code='cohort')
+        other_cohort = Cohort.objects.create(name='Other', code='other')
+        mentor_user = User.objects.create_user(username='mentor')
+        self.mentor = MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor')
+        cohort.mentors.add(self.mentor)
+        self.test = Test.objects.create(name='Midterm', description='')
+        self.other_test = Test.objects.create(name='Other midterm', description='')
+        cohort.tests.add(self.test)
+        other_cohort.tests.add(self.other_test)
+        self.students = []
+        for n, member_of in enumerate([cohort, cohort, other_cohort]):
+            student = StudentProfile.objects.create(user=User.objects.create_user(username=f'student{n}'))
+            member_of.students.add(student)
+            TestScore.objects.create(student=student, test=self.test, score=50)
+            self.students.append(student)
+        self.mentor_client = self.client_for(mentor_user)
+        self.student_client = self.client_for(self.students[0].user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return client
+
+    def changes(self, client, cursor, **params):
+        response = client.get('/portal/changes/', {'cursor': cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, feed):
+        return {action: sorted(row if isinstance(row, int) else row['id'] for row in rows)
+                for action, rows in feed.items() if rows}
+
+    def test_full_sync_from_zero(self):
+        data = self.changes(self.mentor_client, 0)
+        own = [s.id for s in self.students[:2]]
+        self.assertEqual(self.ids(data['changes']['students']), {'created': own})
+        self.assertEqual(self.ids(data['changes']['tests']), {'created': [self.test.id]})
+        self.assertEqual(self.ids(data['changes']['mentors']), {'created': [self.mentor.id]})
+        self.assertEqual(len(data['changes']['test_scores']['created']), 2)
+        self.assertFalse(data['has_more'])
+        data = self.changes(self.mentor_client, data['next_cursor'])
+        self.assertEqual({key: self.ids(feed) for key, feed in data['changes'].items()},
+                         {key: {} for key in data['changes']})
+
+    def test_changes_collapse_to_their_net_effect(self):
+        cursor = ChangeLogEntry.objects.latest('id').id
+        new_test = Test.objects.create(name='Final', description='')
+        new_test.cohorts.add(*self.mentor.cohorts.all())
+        created = TestScore.objects.create(student=self.students[0], test=new_test, score=10)
+        created.score = 20
+        created.save()
+        edited = TestScore.objects.get(student=self.students[1])
+        edited.score = 60
+        edited.save()
+        deleted = TestScore.objects.get(student=self.students[0], test=self.test)
+        deleted.score = 70
+        deleted.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        short_lived = TestScore.objects.create(student=self.students[1], test=new_test, score=30)
+        short_lived_id = short_lived.id
+        short_lived.delete()
+
+        scores = self.changes(self.mentor_client, cursor)['changes']['test_scores']
+        self.assertEqual(self.ids(scores), {
+            'created': [created.id], 'updated': [edited.id], 'deleted': sorted([deleted_id, short_lived_id]),
+        })
+        self.assertEqual(scores['created'][0]['score'], 20)
+        self.assertEqual(scores['updated'][0]['score'], 60)
+
+    def test_hidden_tests_are_reported_deleted(self):
+        cursor = ChangeLogEntry.objects.latest('id').id
+        self.assertEqual(self.mentor_client.delete(f'/portal/tests/{self.test.id}/').status_code, 200)
+        for client in (self.mentor_client, self.student_client):
+            tests = self.changes(client, cursor)['changes']['tests']
+            self.assertEqual(self.ids(tests), {'deleted': [self.test.id]})
+
+    def test_paging_follows_the_cursor(self):
+        expected = self.changes(self.mentor_client, 0)
+        cursor, pages, seen = 0, 0, {}
+        while True:
+            data = self.changes(self.mentor_client, cursor, limit=2)
+            pages += 1
+            self.assertGreater(data['next_cursor'], cursor)
+            for key, feed in data['changes'].items():
+                for action, ids in self.ids(feed).items():
+                    seen.setdefault(key, {}).setdefault(action, []).extend(ids)
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                break
+        # 3 students, 1 mentor, 2 tests and 3 scores were created; 6 of them are visible
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, {key: self.ids(feed) for key, feed in expected['changes'].items() if self.ids(feed)})
+        data = self.changes(self.mentor_client, cursor, limit=2)
+        self.assertEqual((data['next_cursor'], data['has_more']), (cursor, False))
+        self.assertEqual(self.mentor_client.get('/portal/changes/', {'limit': 'x'}).status_code, 400)
+
+    def test_students_see_cohort_tests_and_their_own_records(self):
+        data = self.changes(self.student_client, 0)['changes']
+        self.assertEqual(self.ids(data['students']), {'created': [self.students[0].id]})
+        self.assertEqual(self.ids(data['tests']), {'created': [self.test.id]})
+        self.assertEqual([row['student_id'] for row in data['test_scores']['created']], [self.students[0].id])
+        self.assertEqual(self.ids(data['mentors']), {})
+
+    def test_seed_migration_makes_cursor_zero_a_full_sync(self):
+        expected = self.changes(self.mentor_client, 0)['changes']
+        ChangeLogEntry.objects.all().delete()
+        migration = importlib.import_module('portal.migrations.0005_change_tracking')
+        migration.seed_change_log(apps, None)
+        self.assertEqual(ChangeLogEntry.objects.count(), 3 + 1 + 2 + 3)
+        self.assertEqual(self.changes(self.mentor_client, 0)['changes'], expected)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cohorts = [Cohort.objects.create(name=f'Cohort {i}', code=f'cohort-{i}') for i in range(2)]
+        self.tests = [Test.objects.create(name=f'Test {i}', description='') for i in range(2)]
+        for cohort, test in zip(self.cohorts, self.tests):
+            cohort.tests.add(test)
+        self.students = []
+        for n in range(6):
+            cohort = self.cohorts[n % 2]
+            student = StudentProfile.objects.create(user=User.objects.create_user(username=f'student{n}'))
+            cohort.students.add(student)
+            self.students.append(student)
+            for test in self.tests:
+                TestScore.objects.create(student=student, test=test, score=n * 10 + test.id % 2)
+
+    def test_round_trip_across_chunks(self):
+        self.assertEqual(write_snapshot(self.directory, chunk_size=5), 12)
+        snapshot = load_snapshot(self.directory)
+        scores = TestScore.objects.order_by('id')
+
+        self.assertEqual(len(snapshot), 12)
+        for column, dtype in (('id', np.int64), ('student_id', np.int64), ('test_id', np.int64), ('score', np.int16)):
+            self.assertIsInstance(snapshot.scores[column], np.memmap)
+            self.assertEqual(snapshot.scores[column].dtype, dtype)
+            self.assertEqual(snapshot.scores[column].tolist(), list(scores.values_list(column, flat=True)))
+        self.assertEqual(snapshot.scores['date_taken'].dtype, np.dtype('datetime64[us]'))
+        first = scores.first().date_taken
+        self.assertEqual(snapshot.scores['date_taken'][0], np.datetime64(first.replace(tzinfo=None), 'us'))
+
+        self.assertEqual(snapshot.usernames(snapshot.scores['student_id'][:2]).tolist(), ['student0', 'student0'])
+        self.assertEqual(snapshot.test_names(snapshot.scores['test_id'][:2]).tolist(), ['Test 0', 'Test 1'])
+
+    def test_empty_table(self):
+        TestScore.objects.all().delete()
+        StudentProfile.objects.all().delete()
+        Test.all_objects.all().delete()
+        self.assertEqual(write_snapshot(self.directory), 0)
+        snapshot = load_snapshot(self.directory)
+        self.assertEqual(len(snapshot), 0)
+        self.assertEqual(len(snapshot.students['id']), 0)
+        self.assertEqual(len(snapshot.tests['name']), 0)
+
+    def test_rows_deleted_while_streaming_are_trimmed(self):
+        def delete_later_rows(percent, message):
+            TestScore.objects.filter(id__gt=snapshot_ids[4]).filter(id__lte=snapshot_ids[7]).delete()
+
+        snapshot_ids = list(TestScore.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(write_snapshot(self.directory, chunk_size=4, report_progress=delete_later_rows), 9)
+        snapshot = load_snapshot(self.directory)
+        self.assertEqual(snapshot.scores['id'].tolist(), snapshot_ids[:5] + snapshot_ids[8:])
+        self.assertEqual(len(snapshot.scores['date_taken']), 9)
+        self.assertIsInstance(snapshot.scores['score'], np.memmap)
+        self.assertEqual(snapshot.scores['score'].dtype, np.int16)
+
+    def test_command_and_job_are_scoped_to_cohorts(self):
+        own = [s.id for s in self.students if s.cohorts.filter(id=self.cohorts[0].id).exists()]
+        call_command('export_score_snapshot', self.directory, '--cohort', 'cohort-0', stdout=StringIO())
+        snapshot = load_snapshot(self.directory)
+        self.assertEqual(sorted(set(snapshot.scores['student_id'].tolist())), own)
+        self.assertEqual(snapshot.students['id'].tolist(), own)
+        # Test 1 belongs to the other cohort, but cohort 0 students were scored on it
+        self.assertEqual(snapshot.tests['name'].tolist(), ['Test 0', 'Test 1'])
+        with self.assertRaises(CommandError):
+            call_command('export_score_snapshot', self.directory, '--cohort', 'missing', stdout=StringIO())
+
+        mentor_user = User.objects.create_user(username='mentor')
+        self.cohorts[1].mentors.add(MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor'))
+        with override_settings(JOB_EXPORT_DIR=self.directory):
+            job = jobs.submit('score_snapshot', user=mentor_user)
+            jobs.run_job(jobs.claim_next('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        snapshot = load_snapshot(job.result['path'])
+        self.assertEqual(sorted(set(snapshot.scores['student_id'].tolist())),
+                         [s.id for s in self.students if s.id not in own])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ThrottleTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle.sqlite3')
+        override = override_settings(THROTTLE_DB_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+
+    def login(self, username):
+        return self.client.post('/portal/login/', {'username': username, 'password': 'wrong'}, format='json')
+
+    def test_login_attempts_are_limited_per_username(self):
+        statuses = [self.login('Alice').status_code for _ in range(10)]
+        self.assertNotIn(429, statuses)
+        response = self.login('alice ')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertNotEqual(self.login('bob').status_code, 429)
+
+    def test_preflights_do_not_spend_tokens(self):
+        for _ in range(25):
+            self.assertNotEqual(self.client.options('/portal/register/student/').status_code, 429)
+        self.assertNotEqual(self.client.post('/portal/register/student/', {}, format='json').status_code, 429)
+
+    def test_concurrent_workers_never_share_a_token(self):
+        stores = [BucketStore(), BucketStore()]
+        allowed = []
+
+        def take(store):
+            for _ in range(25):
+                allowed.append(store.take('bucket', 20, 20 / 60, 60, 1000.0)[0])
+
+        threads = [threading.Thread(target=take, args=(stores[i % 2],)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 20)
+        # Half the refill period later half the bucket is back
+        self.assertEqual([stores[0].take('bucket', 20, 20 / 60, 60, 1030.0)[0] for _ in range(11)].count(True), 10)
+
+
+@override_settings(SCORE_EVENTS_POLL_INTERVAL=0.01)
+class ScoreEventTests(TestCase):
+    def setUp(self):
+        self.cohort = Cohort.objects.create(name='Cohort', code='cohort')
+        other_cohort = Cohort.objects.create(name='Other', code='other')
+        self.test = Test.objects.create(name='Midterm', description='')
+        self.student = StudentProfile.objects.create(user=User.objects.create_user(username='student'))
+        self.cohort.students.add(self.student)
+        self.outsider = StudentProfile.objects.create(user=User.objects.create_user(username='outsider'))
+        other_cohort.students.add(self.outsider)
+
+    def add_score(self, student, score):
+        return TestScore.objects.update_or_create(student=student, test=self.test, defaults={'score': score})[0]
+
+    async def next_frame(self, stream):
+        return await asyncio.wait_for(stream.__anext__(), 5)
+
+    async def subscribe(self, last_event_id=None):
+        stream = stream_score_events({self.cohort.id}, last_event_id)
+        self.assertTrue((await self.next_frame(stream)).startswith('retry:'))
+        broker = get_broker()
+        # Wait until the poller has its starting point, so later writes are live events
+        while broker.last_id is None:
+            await asyncio.sleep(0.01)
+        return stream
+
+    def test_reconnect_replays_missed_events_of_own_cohorts(self):
+        self.add_score(self.student, 50)
+        last_seen = TestScoreHistory.objects.latest('id').id
+        self.add_score(self.outsider, 60)
+        self.add_score(self.student, 70)
+        missed = TestScoreHistory.objects.get(student_id=self.student.id, score=70).id
+
+        async def replay():
+            stream = await self.subscribe(last_event_id=last_seen)
+            frame = await self.next_frame(stream)
+            await stream.aclose()
+            return frame
+
+        frame = async_to_sync(replay)()
+        self.assertTrue(frame.startswith(f'id: {missed}\nevent: score.updated\n'))
+
+    @override_settings(SCORE_EVENTS_QUEUE_SIZE=1)
+    def test_slow_consumer_is_disconnected(self):
+        async def overflow():
+            stream = await self.subscribe()
+            for score in (50, 60, 70):
+                await sync_to_async(self.add_score)(self.student, score)
+            while not any(s.overflowed for s in get_broker().subscribers):
+                await asyncio.sleep(0.01)
+            with self.assertRaises(StopAsyncIteration):
+                await self.next_frame(stream)
+
+        async_to_sync(overflow)()
+
+    def test_poller_recovers_from_database_errors(self):
+        fetch_after = events._fetch_after
+        calls = []
+
+        def flaky_fetch_after(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return fetch_after(*args)
+
+        async def live_event():
+            stream = await self.subscribe()
+            await sync_to_async(self.add_score)(self.student, 80)
+            frame = await self.next_frame(stream)
+            await stream.aclose()
+            return frame
+
+        with mock.patch.object(events, '_fetch_after', flaky_fetch_after), \
+                self.assertLogs('portal.events', 'ERROR'):
+            frame = async_to_sync(live_event)()
+        self.assertIn('event: score.created', frame)
+        self.assertGreater(len(calls), 1)
+
+    def test_closed_subscription_ends_stream(self):
+        async def next_row():
+            subscription = Subscription(maxsize=1, cohort_ids={1})
+            subscription.offer({'id': 1}, {1})
+            subscription.close()
+            return await subscription.get(timeout=1)
+
+        self.assertIsNone(async_to_sync(next_row)())
+
+
+class AsyncMiddlewareTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/portal/tests/')
+        self.test = Test.objects.create(name='Midterm', description='')
+
+    def load_tests(self):
+        return list(Test.objects.all())
+
+    async def view(self, request):
+        await sync_to_async(self.load_tests)()
+        return HttpResponse()
+
+    @override_settings(PROFILE_SAMPLE_EVERY=2)
+    def test_profiler_only_leaves_the_event_loop_for_profiled_requests(self):
+        middleware = profiling.RequestProfilerMiddleware(self.view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        samples = profiling.aggregate_report()['samples']
+        with mock.patch.object(profiling, 'sync_to_async', wraps=sync_to_async) as to_thread:
+            async_to_sync(middleware)(self.request)
+            to_thread.assert_not_called()
+            async_to_sync(middleware)(self.request)
+            to_thread.assert_called_once()
+        report = profiling.aggregate_report(limit=1000)
+        self.assertEqual(report['samples'], samples + 1)
+        self.assertTrue(any('load_tests' in row['function'] for row in report['functions']))
+
+    @override_settings(SLOW_QUERY_LOG_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_log_sees_queries_of_async_requests(self):
+        middleware = slow_queries.SlowQueryLogMiddleware(self.view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('portal.slow_queries', 'WARNING'):
+            async_to_sync(middleware)(self.request)
+        self.assertIn('portal/tests.py', slow_queries.recent_entries()[-1]['call_site'])
+
+
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        self.staff = self.client_for('staff', is_staff=True)
+        self.user = self.client_for('user', is_staff=False)
+
+    def client_for(self, username, is_staff):
+        user = User.objects.create_user(username=username, is_staff=is_staff)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return client
+
+    def test_staff_get_a_report_instead_of_the_response(self):
+        for response in (self.staff.get('/portal/tests/', {'profile': '1'}),
+                         self.staff.get('/portal/tests/', HTTP_X_PROFILE='1')):
+            report = response.json()
+            self.assertEqual((report['path'], report['method'], report['status']), ('/portal/tests/', 'GET', 200))
+            self.assertGreater(report['sql']['queries'], 0)
+            self.assertTrue(report['functions'])
+
+    def test_profile_flag_is_ignored_for_non_staff(self):
+        for response in (self.user.get('/portal/tests/', {'profile': '1'}),
+                         self.user.get('/portal/tests/', {'profile': 'store'}, HTTP_X_PROFILE='1'),
+                         APIClient().get('/portal/tests/', {'profile': '1'})):
+            self.assertNotIn('functions', response.json())
+            self.assertNotIn('X-Profile-Report', response)
+
+    def test_store_writes_a_profile_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(PROFILE_DIR=directory.name):
+            response = self.staff.get('/portal/tests/', {'profile': 'store'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        path = os.path.join(directory.name, response['X-Profile-Report'])
+        self.assertTrue(pstats.Stats(path).stats)
+
+    @override_settings(PROFILE_SAMPLE_EVERY=1)
+    def test_paths_outside_the_portal_are_skipped(self):
+        middleware = profiling.RequestProfilerMiddleware(lambda request: HttpResponse('admin'))
+        samples = profiling.aggregate_report()['samples']
+        with mock.patch.object(profiling, '_is_staff') as is_staff:
+            response = middleware(RequestFactory().get('/admin/', {'profile': '1'}))
+        is_staff.assert_not_called()
+        self.assertEqual(response.content, b'admin')
+        self.assertEqual(profiling.aggregate_report()['samples'], samples)
+
+    def test_aggregate_report_is_staff_only(self):
+        self.assertEqual(self.user.get('/portal/profiling/').status_code, 403)
+        response = self.staff.get('/portal/profiling/', {'sort': 'calls'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('samples', response.data)
+        self.assertEqual(self.staff.get('/portal/profiling/', {'sort': 'name'}).status_code, 400)
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        buffer = mock.patch.object(slow_queries, '_buffer', deque(maxlen=50))
+        buffer.start()
+        self.addCleanup(buffer.stop)
+        Test.objects.create(name='Midterm', description='')
+
+    def client_for(self, is_staff):
+        user = User.objects.create_user(username='staff' if is_staff else 'user', is_staff=is_staff)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return client
+
+    def entry(self, sql, duration_ms, plan=None):
+        return {'timestamp': timezone.now().isoformat(), 'duration_ms': duration_ms, 'database': 'default',
+                'sql': sql, 'params_shape': None, 'view': 'portal:test-list', 'path': '/portal/tests/',
+                'call_site': 'portal/views.py:1 in get', 'plan': plan}
+
+    def test_normalize_sql_and_params_shape(self):
+        self.assertEqual(
+            slow_queries.normalize_sql("SELECT  *\nFROM t1 WHERE a = 'it''s' AND b IN (%s, %s, %s) AND c > 12.5"),
+            'SELECT * FROM t1 WHERE a = ? AND b IN (...) AND c > ?',
+        )
+        self.assertIsNone(slow_queries.params_shape(None, False))
+        self.assertEqual(slow_queries.params_shape((1, 'x'), False), ['int', 'str'])
+        self.assertEqual(slow_queries.params_shape({'id': 1}, False), {'id': 'int'})
+        self.assertEqual(slow_queries.params_shape(iter([(1, 'x'), (2, 'y')]), True), {'rows': 2, 'types': ['int', 'str']})
+
+    @override_settings(SLOW_QUERY_LOG_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0)
+    def test_middleware_records_slow_queries_with_plans(self):
+        def view(request):
+            list(Test.objects.filter(name__in=['a', 'b']))
+            Test.objects.filter(name='Midterm').update(description='Changed')
+            return HttpResponse()
+
+        middleware = slow_queries.SlowQueryLogMiddleware(view)
+        with self.assertLogs('portal.slow_queries', 'WARNING'):
+            middleware(RequestFactory().get('/portal/tests/'))
+        select, update = slow_queries.recent_entries()
+        self.assertIn('"portal_test"."name" IN (...)', select['sql'])
+        self.assertEqual(select['params_shape'], ['str', 'str'])
+        self.assertTrue(select['plan'] and not select['plan'][0].startswith('EXPLAIN failed'))
+        self.assertEqual(select['path'], '/portal/tests/')
+        self.assertIn('portal/tests.py', select['call_site'])
+        self.assertTrue(update['sql'].startswith('UPDATE'))
+        self.assertIsNone(update['plan'])
+
+    @override_settings(SLOW_QUERY_LOG_ENABLED=False)
+    def test_middleware_removes_itself_when_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            slow_queries.SlowQueryLogMiddleware(lambda request: HttpResponse())
+
+    def test_top_offenders_groups_by_normalized_sql(self):
+        with self.assertLogs('portal.slow_queries', 'WARNING'):
+            slow_queries.record(self.entry('SELECT a', 10, plan=['scan a']))
+            slow_queries.record(self.entry('SELECT a', 30, plan=['search a']))
+            slow_queries.record(self.entry('SELECT b', 35))
+        by_total = slow_queries.top_offenders('total_ms')
+        self.assertEqual([(g['sql'], g['count'], g['total_ms'], g['max_ms']) for g in by_total],
+                         [('SELECT a', 2, 40.0, 30), ('SELECT b', 1, 35.0, 35)])
+        self.assertEqual(by_total[0]['plan'], ['search a'])
+        self.assertEqual(by_total[0]['views'], ['portal:test-list'])
+        self.assertEqual([g['sql'] for g in slow_queries.top_offenders('max_ms')], ['SELECT b', 'SELECT a'])
+        self.assertEqual([g['sql'] for g in slow_queries.top_offenders('count', limit=1)], ['SELECT a'])
+
+    def test_report_is_staff_only(self):
+        self.assertEqual(self.client_for(is_staff=False).get('/portal/slow-queries/').status_code, 403)
+        staff = self.client_for(is_staff=True)
+        with self.assertLogs('portal.slow_queries', 'WARNING'):
+            slow_queries.record(self.entry('SELECT a', 10))
+        response = staff.get('/portal/slow-queries/', {'order': 'count'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['buffered'], response.data['top'][0]['sql']), (1, 'SELECT a'))
+        self.assertEqual(staff.get('/portal/slow-queries/', {'order': 'sql'}).status_code, 400)
+
+
+class MentorDashboardAPITests(TestCase):
+    # token auth, mentor profile, student count, student page, recent tests
+    QUERY_BUDGET = 5
+
+    def setUp(self):
+        mentor_user = User.objects.create_user(username='mentor')
+        self.cohort = Cohort.objects.create(name='Cohort', code='cohort')
+        self.cohort.mentors.add(MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=mentor_user).key)
+        self.tests = [Test.objects.create(name=f'Test {i}', description='') for i in range(3)]
+        self.cohort.tests.add(*self.tests)
+
+    def add_students(self, count):
+        for _ in range(count):
+            n = StudentProfile.objects.count()
+            user = User.objects.create_user(username=f'student{n}')
+            student = StudentProfile.objects.create(user=user, leetcode='lc', github='gh')
+            self.cohort.students.add(student)
+            for i, test in enumerate(self.tests):
+                TestScore.objects.create(student=student, test=test, score=50 + i * 10)
+
+    def get_dashboard(self, url='/portal/dashboard/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_query_budget_is_fixed(self):
+        self.add_students(2)
+        response, small = self.get_dashboard()
+        self.assertEqual(response.status_code, 200)
+
+        self.add_students(25)
+        response, large = self.get_dashboard('/portal/dashboard/?page_size=50')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['students']['results']), 27)
+
+        self.assertLessEqual(small, self.QUERY_BUDGET)
+        self.assertEqual(small, large)
+
+    def test_summaries(self):
+        self.add_students(2)
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.data['mentor']['user']['username'], 'mentor')
+        self.assertEqual(response.data['students']['count'], 2)
+
+        student = response.data['students']['results'][0]
+        self.assertEqual(student['score_count'], 3)
+        self.assertEqual(student['average_score'], 60)
+        self.assertEqual(student['best_score'], 70)
+
+        tests = {t['name']: t for t in response.data['recent_tests']}
+        self.assertEqual(tests['Test 2']['completion_count'], 2)
+        self.assertEqual(tests['Test 2']['average_score'], 70)
+
+    def test_students_cannot_access(self):
+        user = User.objects.create_user(username='student')
+        StudentProfile.objects.create(user=user, leetcode='lc', github='gh')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        response = client.get('/portal/dashboard/')
+        self.assertEqual(response.status_code, 403)
+
+
+class BatchAPITests(TestCase):
+    def setUp(self):
+        mentor_user = User.objects.create_user(username='mentor')
+        cohort = Cohort.objects.create(name='Cohort', code='cohort')
+        cohort.mentors.add(MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor'))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=mentor_user).key)
+        self.tests = [Test.objects.create(name=f'Test {i}', description='') for i in range(3)]
+        cohort.tests.add(*self.tests)
+        self.students = []
+        for n in range(5):
+            user = User.objects.create_user(username=f'student{n}')
+            student = StudentProfile.objects.create(user=user, leetcode='lc', github='gh')
+            cohort.students.add(student)
+            for test in self.tests:
+                TestScore.objects.create(student=student, test=test, score=80)
+            self.students.append(student)
+
+    def test_lookups_are_merged(self):
+        requests = [{'id': s.id, 'path': f'/portal/profile/student/{s.id}/'} for s in self.students]
+        requests += [{'id': t.id, 'path': f'/portal/tests/{t.id}/'} for t in self.tests]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/portal/batch/', {'requests': requests}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [r['status'] for r in response.data['responses']]
+        self.assertEqual(statuses, [200] * len(requests))
+        self.assertEqual(len(response.data['responses'][0]['body']['test_scores']), 3)
+        # token, mentor role, students, their scores, tests in the mentor's cohorts, tests
+        self.assertEqual(len(queries), 6)
+
+    def test_unknown_and_disallowed_paths(self):
+        requests = [{'path': '/portal/tests/999/'}, {'path': '/portal/batch/'}, {'path': '/admin/'}, {},
+                    {'path': '/portal/test-scores/events/'}]
+        response = self.client.post('/portal/batch/', {'requests': requests}, format='json')
+        self.assertEqual(response.status_code, 200)
+        statuses = [r['status'] for r in response.data['responses']]
+        self.assertEqual(statuses, [404, 404, 404, 400, 404])
+
+
+class CohortScopingTests(TestCase):
+    def setUp(self):
+        self.cohorts = [Cohort.objects.create(name=f'Cohort {i}', code=f'cohort-{i}') for i in range(2)]
+        self.students = []
+        for i, cohort in enumerate(self.cohorts):
+            test = Test.objects.create(name=f'Test {i}', description='')
+            cohort.tests.add(test)
+            for n in range(2):
+                user = User.objects.create_user(username=f'student{i}{n}')
+                student = StudentProfile.objects.create(user=user, leetcode='lc', github='gh')
+                cohort.students.add(student)
+                TestScore.objects.create(student=student, test=test, score=70)
+                self.students.append(student)
+        mentor_user = User.objects.create_user(username='mentor')
+        self.mentor = MentorProfile.objects.create(user=mentor_user, expertise='Python', github='mentor')
+        self.cohorts[0].mentors.add(self.mentor)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=mentor_user).key)
+
+    def test_lists_only_cover_own_cohorts(self):
+        own = {s.id for s in self.students[:2]}
+        response = self.client.get('/portal/students/')
+        self.assertEqual({s['id'] for s in response.data}, own)
+        response = self.client.get('/portal/dashboard/')
+        self.assertEqual({s['id'] for s in response.data['students']['results']}, own)
+        self.assertEqual([t['name'] for t in response.data['recent_tests']], ['Test 0'])
+        response = self.client.get('/portal/tests/')
+        self.assertEqual([t['name'] for t in response.data], ['Test 0'])
+        response = self.client.get('/portal/changes/?cursor=0')
+        self.assertEqual({s['id'] for s in response.data['changes']['students']['created']}, own)
+        self.assertEqual(len(response.data['changes']['test_scores']['created']), 2)
+
+    def test_cohort_filter_must_be_own_cohort(self):
+        response = self.client.get(f'/portal/students/?cohort={self.cohorts[1].id}')
+        self.assertEqual(response.data, [])
+        response = self.client.get(f'/portal/students/?cohort={self.cohorts[0].id}')
+        self.assertEqual(len(response.data), 2)
+
+    def test_profiles_outside_cohorts_are_forbidden(self):
+        response = self.client.get(f'/portal/profile/student/{self.students[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/portal/profile/student/{self.students[2].id}/')
+        self.assertEqual(response.status_code, 403)
+        requests = [{'path': f'/portal/profile/student/{s.id}/'} for s in self.students]
+        response = self.client.post('/portal/batch/', {'requests': requests}, format='json')
+        self.assertEqual([r['status'] for r in response.data['responses']], [200, 200, 403, 403])
+
+    def test_new_tests_join_mentor_cohorts(self):
+        response = self.client.post('/portal/tests/', {'name': 'New', 'description': 'New test'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(Test.objects.get(name='New').cohorts.all()), [self.cohorts[0]])
+        response = self.client.post('/portal/tests/', {'name': 'Other', 'description': 'Other test', 'cohort_id': self.cohorts[1].id},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_writes_outside_cohorts_are_not_found(self):
+        other_test = self.cohorts[1].tests.get()
+        other_score = TestScore.objects.get(student=self.students[2])
+        self.assertEqual(self.client.get(f'/portal/tests/{other_test.id}/').status_code, 404)
+        response = self.client.put(f'/portal/tests/{other_test.id}/', {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(f'/portal/tests/{other_test.id}/').status_code, 404)
+
+        own_test = self.cohorts[0].tests.get()
+        for student, test in ((self.students[2], own_test), (self.students[0], other_test)):
+            response = self.client.post('/portal/test-scores/', {'student_id': student.id, 'test_id': test.id, 'score': 90},
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.put(f'/portal/test-scores/{other_score.id}/', {'score': 10}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(f'/portal/test-scores/{other_score.id}/').status_code, 404)
+        other_score.refresh_from_db()
+        self.assertEqual(other_score.score, 70)
+        self.assertFalse(Test.all_objects.get(id=other_test.id).is_hidden)
+
+    def test_test_names_are_unique_per_cohort(self):
+        response = self.client.post('/portal/tests/', {'name': 'test 1', 'description': 'Same name, other cohort'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/portal/tests/', {'name': 'test 0', 'description': 'Same name, same cohort'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_mentors_join_with_mentor_code_only(self):
+        response = self.client.post('/portal/cohorts/join/', {'code': 'cohort-1'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/portal/cohorts/join/', {'code': self.cohorts[1].mentor_code}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/portal/students/')
+        self.assertEqual(len(response.data), 4)
+        cohorts = self.client.get('/portal/cohorts/').data
+        self.assertEqual([c['mentor_code'] for c in cohorts], [c.mentor_code for c in self.cohorts])
+
+    def test_students_join_with_code_and_never_see_codes(self):
+        student_user = User.objects.create_user(username='newcomer')
+        StudentProfile.objects.create(user=student_user, leetcode='lc', github='gh')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=student_user).key)
+        response = client.post('/portal/cohorts/join/', {'code': self.cohorts[0].mentor_code}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = client.post('/portal/cohorts/join/', {'code': 'cohort-0'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('code', response.data['data'])
+        self.assertEqual(client.get('/portal/cohorts/').data, [{
+            'id': self.cohorts[0].id, 'name': 'Cohort 0', 'created_at': response.data['data']['created_at'],
+        }])
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_mentors_cannot_take_over_the_default_cohort(self):
+        response = self.client.post('/portal/cohorts/', {'name': 'Mine', 'code': settings.DEFAULT_COHORT_CODE}, format='json')
+        self.assertEqual(response.status_code, 400)
+        # A cohort that took the code before it was reserved
+        squatted = Cohort.objects.create(name='Mine', code=settings.DEFAULT_COHORT_CODE)
+        squatted.mentors.add(self.mentor)
+
+        fields = {'email': 's@example.com', 'password': 'secret123', 'leetcode': 'lc', 'github': 'gh'}
+        for username in ('first', 'second'):
+            serializer = StudentRegistrationSerializer(data={'username': username, **fields})
+            self.assertTrue(serializer.is_valid())
+            cohort = serializer.save().cohorts.get()
+            self.assertTrue(cohort.is_default)
+            self.assertNotEqual(cohort.code, settings.DEFAULT_COHORT_CODE)
+        self.assertFalse(squatted.students.exists())
+        self.assertEqual(len(self.client.get('/portal/students/').data), 2)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_mentor_registration(self):
+        default = Cohort.objects.create(name='Default', code=settings.DEFAULT_COHORT_CODE, is_default=True)
+        fields = {'email': 'm@example.com', 'password': 'secret123', 'expertise': 'Python', 'github': 'gh'}
+
+        serializer = MentorRegistrationSerializer(data={'username': 'plain', **fields})
+        self.assertTrue(serializer.is_valid())
+        self.assertFalse(serializer.save().cohorts.exists())
+        self.assertFalse(default.mentors.exists())
+
+        serializer = MentorRegistrationSerializer(data={'username': 'student-code', 'cohort_code': 'cohort-0', **fields})
+        self.assertFalse(serializer.is_valid())
+
+        data = {'username': 'invited', 'cohort_code': self.cohorts[0].mentor_code, **fields}
+        serializer = MentorRegistrationSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(list(serializer.save().cohorts.all()), [self.cohorts[0]])
+
+
+class TestCacheTests(TestCase):
+    def setUp(self):
+        # A fresh shared cache per test, so no version carries over between tests
+        self.enterContext(private_shared_cache())
+        user = User.objects.create_user(username='student')
+        self.student = StudentProfile.objects.create(user=user, leetcode='lc', github='gh')
+        self.tests = [Test.objects.create(name=f'Test {i}', description='') for i in range(3)]
+        for test in self.tests:
+            TestScore.objects.create(student=self.student, test=test, score=70)
+
+    def serialize_scores(self):
+        return TestScoreSerializer(TestScore.objects.filter(student=self.student), many=True).data
+
+    def test_scores_resolve_tests_from_cache(self):
+        test_cache.invalidate()
+        with CaptureQueriesContext(connection) as queries:
+            self.serialize_scores()
+        self.assertEqual(len(queries), 2)  # scores, then every test at once
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.serialize_scores()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data[0]['test']['name'], 'Test 0')
+
+    def test_writes_invalidate(self):
+        self.serialize_scores()
+        self.tests[0].name = 'Renamed'
+        self.tests[0].save()
+        self.assertEqual(self.serialize_scores()[0]['test']['name'], 'Renamed')
+
+    def test_version_change_from_another_worker_invalidates(self):
+        self.serialize_scores()
+        Test.objects.filter(id=self.tests[0].id).update(name='Changed elsewhere')
+        caches[test_cache.version_cache_alias].set(VERSION_KEY, 'other-worker', None)
+        test_cache._checked_at = float('-inf')
+        self.assertEqual(test_cache.get_data(self.tests[0].id)['name'], 'Changed elsewhere')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SeedScaleCommandTests(TestCase):
+    def seed(self, **options):
+        options = {'students': 5, 'mentors': 2, 'tests': 4, 'scores_per_student': 3, **options}
+        call_command('seed_scale', stdout=StringIO(), **options)
+
+    def scores_of(self, prefix):
+        return [
+            (score.student.user.username.split('_', 1)[1], score.test.name, score.score, score.date_taken)
+            for score in TestScore.objects.filter(student__user__username__startswith=f'{prefix}_')
+            .select_related('student__user', 'test').order_by('student__user__username', 'id')
+        ]
+
+    def test_generates_requested_rows(self):
+        self.seed(batch_size=2)
+        self.assertEqual(StudentProfile.objects.count(), 5)
+        self.assertEqual(MentorProfile.objects.count(), 2)
+        self.assertEqual(Token.objects.count(), 7)
+        self.assertEqual(Test.objects.count(), 4)
+        self.assertEqual(TestScore.objects.count(), 15)
+        student = StudentProfile.objects.select_related('user').first()
+        self.assertTrue(student.user.check_password('password'))
+        self.assertEqual(student.testscore_set.values('test').distinct().count(), 3)
+
+    def test_same_seed_same_data_regardless_of_batch_size(self):
+        self.seed(prefix='first', batch_size=2)
+        self.seed(prefix='second', batch_size=10)
+        self.assertEqual(self.scores_of('first'), self.scores_of('second'))
+
+    def test_refuses_existing_prefix(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+class ServeCommandTests(TestCase):
+    def test_warmup_requests_reach_the_api(self):
+        self.assertGreater(warm_serializers(), 0)
+        self.assertEqual(warm_request(), 401)
+        self.assertEqual(async_to_sync(warm_asgi_request)(get_asgi_application()), 401)
+
+    @override_settings(DEBUG=False)
+    def test_workers_serve_admin_static_files(self):
+        self.assertEqual(async_to_sync(warm_asgi_request)(get_application(), '/static/admin/css/base.css'), 200)
+        with override_settings(SERVER_SERVE_STATIC=False):
+            self.assertEqual(async_to_sync(warm_asgi_request)(get_application(), '/static/admin/css/base.css'), 404)
@@ -0,0 +1,145 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# Expired buckets are deleted once every this many takes per process
+PRUNE_EVERY = 1000
+
+
+class BucketStore:
+    """
+    Token buckets in a SQLite file on tmpfs, shared by all workers on a host.
+
+    Refill, check and spend happen in a single UPSERT, so concurrent workers
+    never spend the same token, and each take is one indexed write however
+    many buckets exist.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connection_owner = None
+        self._takes = itertools.count(1)
+
+    def _connection(self):
+        path = str(settings.THROTTLE_DB_PATH)
+        # One connection per process, never reused across fork; under ASGI
+        # each request may run in a new thread, so it is shared between threads
+        if self._connection_owner != (os.getpid(), path):
+            connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, expires REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS bucket_expires ON bucket (expires)')
+            self._db = connection
+            self._connection_owner = (os.getpid(), path)
+        return self._db
+
+    def take(self, key, capacity, refill_rate, duration, now):
+        """
+        Spend one token from the bucket. Returns (allowed, tokens left).
+        """
+        params = {'key': key, 'capacity': capacity, 'rate': refill_rate, 'now': now, 'expires': now + duration}
+        with self._lock:
+            return self._take(self._connection(), params)
+
+    def _take(self, connection, params):
+        row = connection.execute(
+            'INSERT INTO bucket (key, tokens, updated, expires) VALUES (:key, :capacity - 1, :now, :expires) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'tokens = MIN(:capacity, tokens + (:now - updated) * :rate) - 1, updated = :now, expires = :expires '
+            'WHERE MIN(:capacity, tokens + (:now - updated) * :rate) >= 1 '
+            'RETURNING tokens',
+            params,
+        ).fetchone()
+        if next(self._takes) % PRUNE_EVERY == 0:
+            # A bucket untouched for its whole refill period is full again, same as a missing one
+            connection.execute('DELETE FROM bucket WHERE expires < :now', params)
+        if row is not None:
+            return True, row[0]
+        row = connection.execute(
+            'SELECT MIN(:capacity, tokens + (:now - updated) * :rate) FROM bucket WHERE key = :key', params,
+        ).fetchone()
+        return False, row[0] if row else 0
+
+
+bucket_store = BucketStore()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token-bucket throttle keyed by `<view.throttle_scope>_<scope_suffix>`.
+
+    A rate of '10/min' means a bucket of 10 tokens refilled at 10 per minute,
+    so short bursts are allowed while the sustained rate is capped. Buckets
+    live in a host-local BucketStore so all workers on a host see the same
+    counters without touching the database. Only POSTs spend tokens; CORS
+    preflights and other methods pass through.
+    """
+    store = bucket_store
+    scope_suffix = None
+    throttled_methods = ('POST',)
+
+    def __init__(self):
+        # Rate is resolved per view in allow_request(), like ScopedRateThrottle
+        pass
+
+    def allow_request(self, request, view):
+        base_scope = getattr(view, 'throttle_scope', None)
+        if not base_scope or request.method not in self.throttled_methods:
+            return True
+        self.scope = f'{base_scope}_{self.scope_suffix}'
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.refill_rate = self.num_requests / self.duration
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        allowed, self.tokens = self.store.take(
+            self.key, self.num_requests, self.refill_rate, self.duration, self.timer(),
+        )
+        return allowed or self.throttle_failure()
+
+    def wait(self):
+        return (1 - self.tokens) / self.refill_rate
+
+
+class IPThrottle(TokenBucketThrottle):
+    """
+    One bucket per client IP address
+    """
+    scope_suffix = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class UsernameThrottle(TokenBucketThrottle):
+    """
+    One bucket per submitted username, so a distributed attack on a single
+    account is limited even when it comes from many addresses
+    """
+    scope_suffix = 'username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username or not isinstance(username, str):
+            return None
+        ident = hashlib.sha256(username.strip().lower().encode()).hexdigest()
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': ident
+        }
@@ -9,8 +9,20 @@ urlpatterns = [
     path('profile/student/<int:student_id>/', StudentProfileAPIView.as_view(), name='student-profile-detail'),
     path('profile/mentor/', MentorProfileAPIView.as_view(), name='mentor-profile'),
     path('students/', AllStudentsAPIView.as_view(), name='all-students'),
+    path('cohorts/', CohortListAPIView.as_view(), name='cohort-list'),
+    path('cohorts/join/', CohortJoinAPIView.as_view(), name='cohort-join'),
+    path('dashboard/', MentorDashboardAPIView.as_view(), name='mentor-dashboard'),
     path('tests/', TestListAPIView.as_view(), name='test-list'),
     path('tests/<int:test_id>/', TestDetailAPIView.as_view(), name='test-detail'),
     path('test-scores/', TestScoreAPIView.as_view(), name='add-test-score'),
     path('test-scores/<int:score_id>/', TestScoreAPIView.as_view(), name='update-delete-test-score'),
+    path('test-scores/events/', ScoreEventStreamView.as_view(), name='test-score-events'),
+    path('test-scores/history/', TestScoreHistoryAPIView.as_view(), name='test-score-history'),
+    path('changes/', ChangesAPIView.as_view(), name='changes'),
+    path('batch/', BatchAPIView.as_view(), name='batch'),
+    path('cache/stats/', CacheStatsAPIView.as_view(), name='cache-stats'),
+    path('slow-queries/', SlowQueryAPIView.as_view(), name='slow-queries'),
+    path('profiling/', ProfilingAPIView.as_view(), name='profiling'),
+    path('jobs/', JobListAPIView.as_view(), name='job-list'),
+    path('jobs/<int:job_id>/', JobDetailAPIView.as_view(), name='job-detail'),
 ]
\ No newline at end of file
@@ -1,20 +1,100 @@
+import base64
+import binascii
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-from .models import StudentProfile, MentorProfile, TestScore
+from django.views import View
+from django.http import JsonResponse, StreamingHttpResponse
+from django.http import Http404
+from urllib.parse import urlsplit
+from django.core.paginator import Paginator, EmptyPage
+from django.db import transaction
+from django.db.models import Q, Count, Avg, Max
+from django.utils.dateparse import parse_datetime
+from .models import StudentProfile, MentorProfile, TestScore, Job, TestScoreHistory, ChangeLogEntry, Cohort
+from .signals import record_change
+from . import jobs
+from .throttling import IPThrottle, UsernameThrottle
+from .events import stream_score_events
+from .cache import test_cache, invalidate_tests
+from .cohorts import (
+    CohortMentor, CohortTest, mentor_cohort_ids, user_cohort_ids,
+    cohort_student_ids, cohort_mentor_ids, cohort_test_ids, mentor_can_view_student, test_in_cohorts,
+)
+from . import slow_queries, profiling
+from .batching import BATCHABLE_ROUTES, BatchLoader, build_sub_request, resolve_sub_request
 from .serializers import *
 
+def encode_cursor(timestamp, row_id):
+    """
+    Opaque, URL-safe keyset cursor for (timestamp, id) ordering
+    """
+    raw = f'{timestamp.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split('|')
+        parsed = parse_datetime(timestamp)
+        row_id = int(row_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+    if parsed is None:
+        raise ValueError('Invalid cursor')
+    return parsed, row_id
+
+def get_loaded_object_or_404(request, model, pk):
+    """
+    get_object_or_404 that goes through the per-batch loader inside /batch/,
+    and the Test cache for tests; tests outside the user's cohorts are not found
+    """
+    loader = getattr(request, 'batch_loader', None)
+    if loader is not None:
+        obj = loader.get(model, pk)
+    elif model is Test:
+        obj = test_cache.get(pk) if test_in_cohorts(pk, user_cohort_ids(request.user)) else None
+    else:
+        return get_object_or_404(model, id=pk)
+    if obj is None:
+        raise Http404
+    return obj
+
+def get_mentor_profile(request):
+    """
+    The requesting user's MentorProfile; raises MentorProfile.DoesNotExist
+    """
+    loader = getattr(request, 'batch_loader', None)
+    if loader is None:
+        return MentorProfile.objects.get(user=request.user)
+    mentor_profile = loader.mentor_profile()
+    if mentor_profile is None:
+        raise MentorProfile.DoesNotExist
+    return mentor_profile
+
+def get_scoped_cohort_ids(request, mentor_profile):
+    """
+    Subquery of the mentor's cohorts, narrowed to ?cohort= when given;
+    raises ValueError for a non-integer cohort
+    """
+    cohort_id = request.query_params.get('cohort')
+    return mentor_cohort_ids(mentor_profile, int(cohort_id) if cohort_id else None)
+
 class StudentRegistrationAPIView(APIView):
     """
     Register a new student
     """
     permission_classes = [AllowAny]
-    authentication_classes = [] 
+    authentication_classes = []
+    throttle_classes = [IPThrottle]
+    throttle_scope = 'register'
     def post(self, request):
         uername = request.data.get('username')
         if User.objects.filter(username=uername).exists():
@@ -43,6 +123,8 @@ class MentorRegistrationAPIView(APIView):
     """
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [IPThrottle]
+    throttle_scope = 'register'
     def post(self, request):
         uername = request.data.get('username')
         if User.objects.filter(username=uername).exists():
@@ -71,6 +153,8 @@ class LoginAPIView(APIView):
     """
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [IPThrottle, UsernameThrottle]
+    throttle_scope = 'login'
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -109,7 +193,7 @@ class LoginAPIView(APIView):
 class StudentProfileAPIView(APIView):
     """
     Get and update student profile with test scores
-    Accessible by the student themselves or any mentor (GET)
+    Accessible by the student themselves or a mentor of one of their cohorts (GET)
     Only student can update their own profile (PUT)
     """
     authentication_classes = [TokenAuthentication]
@@ -119,14 +203,19 @@ class StudentProfileAPIView(APIView):
         user = request.user
         
         # Check if user is a mentor
-        is_mentor = MentorProfile.objects.filter(user=user).exists()
+        try:
+            mentor_profile = get_mentor_profile(request)
+        except MentorProfile.DoesNotExist:
+            mentor_profile = None
         
         if student_id:
             # If student_id is provided, check permissions
-            student_profile = get_object_or_404(StudentProfile, id=student_id)
+            student_profile = get_loaded_object_or_404(request, StudentProfile, student_id)
             
-            # Allow access if user is the student themselves or a mentor
-            if not is_mentor and student_profile.user != user:
+            # Allow access if user is the student themselves or one of their mentors
+            if student_profile.user_id != user.id and (
+                mentor_profile is None or not mentor_can_view_student(mentor_profile, student_profile)
+            ):
                 return Response({
                     'error': 'You do not have permission to view this student profile'
                 }, status=status.HTTP_403_FORBIDDEN)
@@ -184,7 +273,7 @@ class MentorProfileAPIView(APIView):
     
     def get(self, request):
         try:
-            mentor_profile = MentorProfile.objects.get(user=request.user)
+            mentor_profile = get_mentor_profile(request)
             serializer = MentorProfileSerializer(mentor_profile)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except MentorProfile.DoesNotExist:
@@ -216,7 +305,8 @@ class MentorProfileAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 class AllStudentsAPIView(APIView):
     """
-    Get all students (only accessible by mentors)
+    Get all students in the mentor's cohorts (only accessible by mentors)
+    Query params: ?cohort= to list a single cohort
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
@@ -224,37 +314,46 @@ class AllStudentsAPIView(APIView):
     def get(self, request):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = get_mentor_profile(request)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can access this endpoint'
             }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            cohort_ids = get_scoped_cohort_ids(request, mentor_profile)
+        except ValueError:
+            return Response({
+                'error': 'cohort must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        students = StudentProfile.objects.all()
+        students = (
+            StudentProfile.objects.filter(id__in=cohort_student_ids(cohort_ids))
+            .select_related('user').prefetch_related('testscore_set')
+        )
         serializer = StudentProfileSerializer(students, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 class TestDetailAPIView(APIView):
     """
-    Get, update, and delete specific tests (mentor only for PUT/DELETE)
+    Get, update, and delete specific tests of your cohorts (mentor only for PUT/DELETE)
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request, test_id):
-        test = get_object_or_404(Test, id=test_id)
+        test = get_loaded_object_or_404(request, Test, test_id)
         serializer = TestSerializer(test)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     def put(self, request, test_id):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = MentorProfile.objects.get(user=request.user)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can update tests'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        test = get_object_or_404(Test, id=test_id)
+        test = get_object_or_404(Test.objects.filter(id__in=cohort_test_ids(mentor_cohort_ids(mentor_profile))), id=test_id)
         serializer = TestUpdateSerializer(test, data=request.data, partial=True)
         if serializer.is_valid():
             updated_test = serializer.save()
@@ -268,43 +367,64 @@ class TestDetailAPIView(APIView):
     def delete(self, request, test_id):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = MentorProfile.objects.get(user=request.user)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can delete tests'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        test = get_object_or_404(Test, id=test_id)
+        test = get_object_or_404(Test.objects.filter(id__in=cohort_test_ids(mentor_cohort_ids(mentor_profile))), id=test_id)
         test_name = test.name
-        test.delete()
+        # Hide the test immediately; its scores are purged in batches by a background job
+        with transaction.atomic():
+            Test.all_objects.filter(id=test.id).update(is_hidden=True)
+            invalidate_tests()
+            record_change(test, ChangeLogEntry.ACTION_DELETED)
+            job = jobs.submit('delete_test', {'test_id': test.id}, user=request.user)
         return Response({
-            'message': f'Test "{test_name}" deleted successfully'
+            'message': f'Test "{test_name}" deleted successfully',
+            'job_id': job.id
         }, status=status.HTTP_200_OK)  
 
 class TestListAPIView(APIView):
     """
-    Get all available tests and create new tests (mentor only for POST)
+    Get the tests of your cohorts and create new tests (mentor only for POST)
+    New tests are added to all of the mentor's cohorts, or only to cohort_id if given
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        tests = Test.objects.all().order_by('-created_at')
+        tests = Test.objects.filter(id__in=cohort_test_ids(user_cohort_ids(request.user))).order_by('-created_at')
         serializer = TestSerializer(tests, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     def post(self, request):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = MentorProfile.objects.get(user=request.user)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can create tests'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        serializer = TestCreateSerializer(data=request.data)
+        try:
+            cohort_id = request.data.get('cohort_id')
+            cohort_ids = list(mentor_cohort_ids(mentor_profile, int(cohort_id) if cohort_id is not None else None)
+                              .values_list('cohort_id', flat=True))
+        except (TypeError, ValueError):
+            return Response({
+                'error': 'cohort_id must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not cohort_ids:
+            return Response({
+                'error': 'You are not a mentor of this cohort' if cohort_id is not None else 'Join a cohort before creating tests'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = TestCreateSerializer(data=request.data, context={'cohort_ids': cohort_ids})
         if serializer.is_valid():
             test = serializer.save()
+            CohortTest.objects.bulk_create([CohortTest(cohort_id=c, test_id=test.id) for c in cohort_ids])
             response_serializer = TestSerializer(test)
             return Response({
                 'message': 'Test created successfully',
@@ -315,7 +435,7 @@ class TestListAPIView(APIView):
 
 class TestScoreAPIView(APIView):
     """
-    Add and update test scores (mentor only)
+    Add and update test scores of students in your cohorts (mentor only)
     """
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
@@ -323,15 +443,17 @@ class TestScoreAPIView(APIView):
     def post(self, request):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = MentorProfile.objects.get(user=request.user)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can add test scores'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        serializer = TestScoreCreateSerializer(data=request.data)
+        serializer = TestScoreCreateSerializer(data=request.data, context={'cohort_ids': mentor_cohort_ids(mentor_profile)})
         if serializer.is_valid():
-            test_score = serializer.save()
+            # The history and change log rows are written by signals; commit them with the score
+            with transaction.atomic():
+                test_score = serializer.save()
             response_serializer = TestScoreSerializer(test_score)
             return Response({
                 'message': 'Test score added successfully',
@@ -342,16 +464,19 @@ class TestScoreAPIView(APIView):
     def put(self, request, score_id):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = MentorProfile.objects.get(user=request.user)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can update test scores'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        test_score = get_object_or_404(TestScore, id=score_id)
+        test_score = get_object_or_404(
+            TestScore.objects.filter(student_id__in=cohort_student_ids(mentor_cohort_ids(mentor_profile))), id=score_id,
+        )
         serializer = TestScoreUpdateSerializer(test_score, data=request.data)
         if serializer.is_valid():
-            test_score = serializer.save()
+            with transaction.atomic():
+                test_score = serializer.save()
             response_serializer = TestScoreSerializer(test_score)
             return Response({
                 'message': 'Test score updated successfully',
@@ -362,14 +487,536 @@ class TestScoreAPIView(APIView):
     def delete(self, request, score_id):
         # Check if user is a mentor
         try:
-            MentorProfile.objects.get(user=request.user)
+            mentor_profile = MentorProfile.objects.get(user=request.user)
         except MentorProfile.DoesNotExist:
             return Response({
                 'error': 'Only mentors can delete test scores'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        test_score = get_object_or_404(TestScore, id=score_id)
+        test_score = get_object_or_404(
+            TestScore.objects.filter(student_id__in=cohort_student_ids(mentor_cohort_ids(mentor_profile))), id=score_id,
+        )
         test_score.delete()
         return Response({
             'message': 'Test score deleted successfully'
         }, status=status.HTTP_200_OK)
+
+
+class JobListAPIView(APIView):
+    """
+    Submit background jobs and list your own jobs (mentor only)
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        job_list = Job.objects.filter(created_by=request.user).order_by('-created_at')[:50]
+        serializer = JobSerializer(job_list, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        # Check if user is a mentor
+        try:
+            MentorProfile.objects.get(user=request.user)
+        except MentorProfile.DoesNotExist:
+            return Response({
+                'error': 'Only mentors can submit jobs'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = JobCreateSerializer(data=request.data)
+        if serializer.is_valid():
+            job = jobs.submit(
+                serializer.validated_data['kind'],
+                serializer.validated_data['payload'],
+                user=request.user,
+            )
+            return Response({
+                'message': 'Job submitted successfully',
+                'data': JobSerializer(job).data
+            }, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class JobDetailAPIView(APIView):
+    """
+    Poll the status and progress of a background job
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(Job, id=job_id)
+        if job.created_by_id != request.user.id and not request.user.is_staff:
+            return Response({
+                'error': 'You do not have permission to view this job'
+            }, status=status.HTTP_403_FORBIDDEN)
+        serializer = JobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class TestScoreHistoryAPIView(APIView):
+    """
+    Time-range query over the score history of the mentor's cohorts (mentor only)
+    Filters: ?start=&end= (ISO 8601), ?student_id=, ?cohort=
+    Keyset paginated on (timestamp, id): pass back ?cursor=<next_cursor>
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    default_limit = 100
+    max_limit = 1000
+
+    def get(self, request):
+        # Check if user is a mentor
+        try:
+            mentor_profile = MentorProfile.objects.get(user=request.user)
+        except MentorProfile.DoesNotExist:
+            return Response({
+                'error': 'Only mentors can view score history'
+            }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            cohort_ids = get_scoped_cohort_ids(request, mentor_profile)
+        except ValueError:
+            return Response({
+                'error': 'cohort must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = TestScoreHistory.objects.filter(student_id__in=cohort_student_ids(cohort_ids))
+        for param, lookup in (('start', 'timestamp__gte'), ('end', 'timestamp__lt')):
+            value = request.query_params.get(param)
+            if value:
+                parsed = parse_datetime(value)
+                if parsed is None:
+                    return Response({
+                        'error': f'Invalid {param} datetime'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                entries = entries.filter(**{lookup: parsed})
+
+        try:
+            student_id = request.query_params.get('student_id')
+            if student_id:
+                entries = entries.filter(student_id=int(student_id))
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return Response({
+                'error': 'student_id and limit must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                cursor_ts, cursor_id = decode_cursor(cursor)
+            except ValueError:
+                return Response({
+                    'error': 'Invalid cursor'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            entries = entries.filter(
+                Q(timestamp__gt=cursor_ts) | Q(timestamp=cursor_ts, id__gt=cursor_id)
+            )
+
+        page = list(entries.order_by('timestamp', 'id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].timestamp, page[-1].id) if has_more else None
+        return Response({
+            'results': TestScoreHistorySerializer(page, many=True).data,
+            'next_cursor': next_cursor
+        }, status=status.HTTP_200_OK)
+
+
+class MentorDashboardAPIView(APIView):
+    """
+    Everything the mentor front-end needs on load in one response (mentor only):
+    profile, a page of the students in their cohorts with score summaries, and
+    the cohorts' recent tests with completion counts. Built from a fixed number
+    of aggregate queries regardless of how many students or scores exist.
+    Query params: ?page=, ?page_size= (students), ?recent_tests=, ?cohort=
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    default_page_size = 20
+    max_page_size = 100
+    default_recent_tests = 10
+
+    def get(self, request):
+        # Check if user is a mentor
+        try:
+            mentor_profile = MentorProfile.objects.select_related('user').get(user=request.user)
+        except MentorProfile.DoesNotExist:
+            return Response({
+                'error': 'Only mentors can access this endpoint'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            page_number = int(request.query_params.get('page', 1))
+            page_size = max(1, min(int(request.query_params.get('page_size', self.default_page_size)), self.max_page_size))
+            recent_tests = max(1, min(int(request.query_params.get('recent_tests', self.default_recent_tests)), self.max_page_size))
+            cohort_ids = get_scoped_cohort_ids(request, mentor_profile)
+        except ValueError:
+            return Response({
+                'error': 'page, page_size, recent_tests and cohort must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        student_ids = cohort_student_ids(cohort_ids)
+        visible = Q(testscore__test__is_hidden=False)
+        students = (
+            StudentProfile.objects.filter(id__in=student_ids).select_related('user')
+            .annotate(
+                score_count=Count('testscore', filter=visible),
+                average_score=Avg('testscore__score', filter=visible),
+                best_score=Max('testscore__score', filter=visible),
+                last_score_at=Max('testscore__date_taken', filter=visible),
+            )
+            .order_by('id')
+        )
+        paginator = Paginator(students, page_size)
+        try:
+            page = paginator.page(page_number)
+        except EmptyPage:
+            return Response({
+                'error': 'Page out of range'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        # Completions count only this mentor's students
+        in_cohort = Q(testscore__student_id__in=student_ids)
+        tests = (
+            Test.objects.filter(id__in=cohort_test_ids(cohort_ids))
+            .annotate(
+                completion_count=Count('testscore', filter=in_cohort),
+                average_score=Avg('testscore__score', filter=in_cohort),
+            )
+            .order_by('-created_at')[:recent_tests]
+        )
+
+        return Response({
+            'mentor': MentorProfileSerializer(mentor_profile).data,
+            'students': {
+                'count': paginator.count,
+                'page': page.number,
+                'num_pages': paginator.num_pages,
+                'results': DashboardStudentSerializer(page.object_list, many=True).data,
+            },
+            'recent_tests': DashboardTestSerializer(tests, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+class BatchAPIView(APIView):
+    """
+    Run several GET requests against portal endpoints in one round trip
+    Body: {"requests": [{"id": "a", "path": "/portal/tests/3/"}, ...]}
+    Authentication happens once for the whole batch, and lookups of the same
+    kind (student profiles, tests, the caller's role) are merged into one
+    query each through a shared BatchLoader.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_requests = 50
+
+    @staticmethod
+    def is_batchable_view(view_class):
+        # Only synchronous DRF views can be called inline; async views such as
+        # the event stream return a coroutine
+        return (view_class.__module__ == __name__ and view_class is not BatchAPIView
+                and issubclass(view_class, APIView) and not view_class.view_is_async)
+
+    def post(self, request):
+        sub_requests = request.data.get('requests') if hasattr(request.data, 'get') else None
+        if not isinstance(sub_requests, list) or not sub_requests:
+            return Response({
+                'error': 'requests must be a non-empty list'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(sub_requests) > self.max_requests:
+            return Response({
+                'error': f'At most {self.max_requests} requests per batch'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        loader = BatchLoader(request.user)
+
+        # Resolve everything first so the loader knows every id it will be asked for
+        resolved = []
+        for index, item in enumerate(sub_requests):
+            item_id = item.get('id', index) if isinstance(item, dict) else index
+            path = item.get('path') if isinstance(item, dict) else None
+            if not isinstance(path, str):
+                resolved.append((item_id, None, None))
+                continue
+            url = urlsplit(path)
+            match = resolve_sub_request(url.path, self.is_batchable_view)
+            if match is not None and match.url_name in BATCHABLE_ROUTES:
+                model, kwarg = BATCHABLE_ROUTES[match.url_name]
+                loader.want(model, match.kwargs[kwarg])
+            resolved.append((item_id, url, match))
+
+        responses = []
+        for item_id, url, match in resolved:
+            if url is None:
+                responses.append({'id': item_id, 'status': status.HTTP_400_BAD_REQUEST,
+                                  'body': {'error': 'path is required'}})
+                continue
+            if match is None:
+                responses.append({'id': item_id, 'status': status.HTTP_404_NOT_FOUND,
+                                  'body': {'error': 'Not found'}})
+                continue
+            sub_request = build_sub_request(request, url.path, url.query, loader)
+            response = match.func(sub_request, *match.args, **match.kwargs)
+            responses.append({'id': item_id, 'status': response.status_code,
+                              'body': getattr(response, 'data', None)})
+
+        return Response({'responses': responses}, status=status.HTTP_200_OK)
+
+
+class ChangesAPIView(APIView):
+    """
+    Incremental sync feed: everything created, updated or deleted since ?cursor=
+    Start with cursor=0 and pass back next_cursor until has_more is false.
+    Mentors see changes to the students, scores, tests and mentors of their
+    cohorts; students see their cohorts' tests plus their own profile and scores.
+    Membership is applied when reading, so resync from cursor=0 after joining a cohort.
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    default_limit = 500
+    max_limit = 2000
+    # ChangeLogEntry.model -> (response key, queryset for payloads, serializer)
+    feeds = {
+        'student': ('students', lambda: StudentProfile.objects.select_related('user'), StudentProfileChangeSerializer),
+        'mentor': ('mentors', lambda: MentorProfile.objects.select_related('user'), MentorProfileChangeSerializer),
+        'test': ('tests', lambda: Test.objects.all(), TestSerializer),
+        'test_score': ('test_scores', lambda: TestScore.objects.all(), TestScoreChangeSerializer),
+    }
+
+    def get(self, request):
+        try:
+            cursor = max(0, int(request.query_params.get('cursor', 0)))
+            limit = max(1, min(int(request.query_params.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return Response({
+                'error': 'cursor and limit must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = ChangeLogEntry.objects.filter(id__gt=cursor)
+        try:
+            mentor_profile = get_mentor_profile(request)
+        except MentorProfile.DoesNotExist:
+            student_id = StudentProfile.objects.filter(user=request.user).values_list('id', flat=True).first()
+            visible = Q(model='test', object_id__in=cohort_test_ids(user_cohort_ids(request.user)))
+            if student_id is not None:
+                visible |= Q(student_id=student_id)
+        else:
+            cohort_ids = mentor_cohort_ids(mentor_profile)
+            visible = (
+                Q(model__in=['student', 'test_score'], student_id__in=cohort_student_ids(cohort_ids))
+                | Q(model='test', object_id__in=cohort_test_ids(cohort_ids))
+                | Q(model='mentor', object_id__in=cohort_mentor_ids(cohort_ids))
+            )
+        entries = entries.filter(visible)
+
+        page = list(entries.order_by('id').values_list('id', 'model', 'object_id', 'action')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        # Collapse repeated entries for the same object to its net change in this page
+        net = {}
+        for _, model, object_id, action in page:
+            first_action, _ = net.get((model, object_id), (action, None))
+            net[(model, object_id)] = (first_action, action)
+
+        changes = {key: {'created': [], 'updated': [], 'deleted': []} for key, _, _ in self.feeds.values()}
+        for model, (key, queryset, serializer_class) in self.feeds.items():
+            live_ids = [
+                object_id for (entry_model, object_id), (_, last) in net.items()
+                if entry_model == model and last != ChangeLogEntry.ACTION_DELETED
+            ]
+            objects = queryset().in_bulk(live_ids) if live_ids else {}
+            for (entry_model, object_id), (first, last) in net.items():
+                if entry_model != model:
+                    continue
+                obj = objects.get(object_id)
+                if obj is None:
+                    # Deleted, or no longer visible (e.g. a hidden test)
+                    changes[key]['deleted'].append(object_id)
+                elif first == ChangeLogEntry.ACTION_CREATED:
+                    changes[key]['created'].append(serializer_class(obj).data)
+                else:
+                    changes[key]['updated'].append(serializer_class(obj).data)
+
+        return Response({
+            'changes': changes,
+            'next_cursor': page[-1][0] if page else cursor,
+            'has_more': has_more
+        }, status=status.HTTP_200_OK)
+
+
+class ScoreEventStreamView(View):
+    """
+    Server-sent events stream of score creates, updates and deletes for the
+    students of the mentor's cohorts (mentor only)
+    Must be served by an ASGI server. Authenticate with the Authorization header,
+    or ?token= for EventSource clients that cannot set headers. Reconnects
+    resume from the Last-Event-ID header (or ?last_event_id=).
+    """
+
+    async def get(self, request):
+        key = request.GET.get('token')
+        auth = request.headers.get('Authorization', '').split()
+        if len(auth) == 2 and auth[0].lower() == 'token':
+            key = auth[1]
+        try:
+            token = await Token.objects.select_related('user').aget(key=key or '')
+        except Token.DoesNotExist:
+            return JsonResponse({
+                'error': 'Invalid or missing token'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        mentor_profile = await MentorProfile.objects.filter(user=token.user).afirst()
+        if not token.user.is_active or mentor_profile is None:
+            return JsonResponse({
+                'error': 'Only mentors can subscribe to score events'
+            }, status=status.HTTP_403_FORBIDDEN)
+        cohort_ids = {
+            cohort_id async for cohort_id in
+            CohortMentor.objects.filter(mentorprofile=mentor_profile).values_list('cohort_id', flat=True)
+        }
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        response = StreamingHttpResponse(stream_score_events(cohort_ids, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class CohortListAPIView(APIView):
+    """
+    List your cohorts, and create a new cohort you mentor (mentor only for POST)
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        cohorts = Cohort.objects.filter(id__in=user_cohort_ids(request.user)).order_by('name')
+        # A mentor's cohorts are all cohorts they mentor, so they see the join codes
+        is_mentor = MentorProfile.objects.filter(user=request.user).exists()
+        serializer = (MentorCohortSerializer if is_mentor else CohortSerializer)(cohorts, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        # Check if user is a mentor
+        try:
+            mentor_profile = MentorProfile.objects.get(user=request.user)
+        except MentorProfile.DoesNotExist:
+            return Response({
+                'error': 'Only mentors can create cohorts'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = CohortCreateSerializer(data=request.data)
+        if serializer.is_valid():
+            cohort = serializer.save()
+            cohort.mentors.add(mentor_profile)
+            return Response({
+                'message': 'Cohort created successfully',
+                'data': MentorCohortSerializer(cohort).data
+            }, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CohortJoinAPIView(APIView):
+    """
+    Join a cohort with its code as a student, or with its mentor code as a mentor
+    Body: {"code": "..."}
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        code = request.data.get('code') or ''
+        mentor_profile = MentorProfile.objects.filter(user=request.user).first()
+        if mentor_profile is not None:
+            cohort = Cohort.objects.filter(mentor_code=code).first()
+            member, members, cohort_serializer = mentor_profile, 'mentors', MentorCohortSerializer
+        else:
+            cohort = Cohort.objects.filter(code=code).first()
+            member = StudentProfile.objects.filter(user=request.user).first()
+            if member is None:
+                return Response({
+                    'error': 'User is neither a student nor a mentor'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            members, cohort_serializer = 'students', CohortSerializer
+        if cohort is None:
+            return Response({
+                'error': 'No cohort with this code'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        getattr(cohort, members).add(member)
+        return Response({
+            'message': f'Joined cohort "{cohort.name}"',
+            'data': cohort_serializer(cohort).data
+        }, status=status.HTTP_200_OK)
+
+
+class CacheStatsAPIView(APIView):
+    """
+    Hit/miss statistics for this worker process's Test cache (staff only)
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'test_cache': test_cache.stats()
+        }, status=status.HTTP_200_OK)
+
+
+class SlowQueryAPIView(APIView):
+    """
+    Top offenders from this worker's slow query log (staff only)
+    Query params: ?order=total_ms|max_ms|count, ?limit=
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        order = request.query_params.get('order', 'total_ms')
+        if order not in ('total_ms', 'max_ms', 'count'):
+            return Response({
+                'error': 'order must be one of total_ms, max_ms, count'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            return Response({
+                'error': 'limit must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'enabled': settings.SLOW_QUERY_LOG_ENABLED,
+            'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+            'buffered': len(slow_queries.recent_entries()),
+            'top': slow_queries.top_offenders(order, limit)
+        }, status=status.HTTP_200_OK)
+
+
+class ProfilingAPIView(APIView):
+    """
+    Hot functions aggregated over this worker's sampled requests (staff only)
+    Query params: ?sort=tottime|cumulative|calls, ?limit=
+    """
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        sort = request.query_params.get('sort', 'tottime')
+        if sort not in ('tottime', 'cumulative', 'calls'):
+            return Response({
+                'error': 'sort must be one of tottime, cumulative, calls'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 40)), 200))
+        except ValueError:
+            return Response({
+                'error': 'limit must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        report = profiling.aggregate_report(limit, sort)
+        report['sample_every'] = settings.PROFILE_SAMPLE_EVERY
+        return Response(report, status=status.HTTP_200_OK)